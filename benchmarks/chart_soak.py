@@ -0,0 +1,99 @@
+"""
+Soak test for the chart layer.
+
+Renders charts from ever-changing aggregate data (so most renders miss the
+cache) and checks that resident memory stops growing and that no figures
+are left registered with pyplot.
+
+    python -m benchmarks.chart_soak --iterations 2000
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from utils import charts
+
+
+def rss_bytes():
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # Peak RSS is the best portable fallback (KiB on Linux, bytes on macOS)
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == "darwin" else usage * 1024
+
+
+def monthly_frame(rng, months=12, categories=5):
+    index = pd.period_range("2024-01", periods=months, freq="M").astype(str)
+    columns = [f"Category {i}" for i in range(categories)]
+    return pd.DataFrame(rng.uniform(0, 10000, (months, categories)), index=index, columns=columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, help="Iterations before the baseline (default: until the chart cache is full)")
+    parser.add_argument("--distinct", type=int, default=50, help="Distinct datasets cycled through")
+    parser.add_argument("--max-growth-mb", type=float, default=50.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    datasets = [monthly_frame(rng) for _ in range(args.distinct)]
+
+    def render(i):
+        data = datasets[i % len(datasets)] * (1 + i)  # new data on every iteration
+        charts.render_chart("stacked_bar", data, title="Monthly Expenditure by Category")
+        charts.render_chart("line", data.sum(axis=1), title="Historical Expenditure Trend")
+        charts.render_chart("pie", data.iloc[0], colors=None)
+
+    # Warm up before taking the baseline so growth is measured against steady
+    # state: by default until the byte-bounded render cache is full
+    def warmed_up(done):
+        if args.warmup is not None:
+            return done >= args.warmup
+        return charts.cache_info()[1] >= 0.95 * charts.CHART_CACHE_BYTES
+
+    warmup = 0
+    while not warmed_up(warmup):
+        render(warmup)
+        warmup += 1
+    gc.collect()
+    baseline = rss_bytes()
+
+    samples = [baseline]
+    interval = max(1, args.iterations // 20)
+    for i in range(warmup, warmup + args.iterations):
+        render(i)
+        if (i - warmup + 1) % interval == 0:
+            gc.collect()
+            samples.append(rss_bytes())
+
+    import matplotlib.pyplot as plt
+    growth_mb = (max(samples) - baseline) / 1024 / 1024
+    cached_charts, cached_bytes = charts.cache_info()
+    result = {
+        "iterations": args.iterations,
+        "warmup": warmup,
+        "rss_start_mb": round(baseline / 1024 / 1024, 1),
+        "rss_end_mb": round(samples[-1] / 1024 / 1024, 1),
+        "rss_growth_mb": round(growth_mb, 1),
+        "open_pyplot_figures": len(plt.get_fignums()),
+        "cached_charts": cached_charts,
+        "cached_bytes": cached_bytes,
+    }
+    print(json.dumps(result, indent=2))
+
+    if growth_mb > args.max_growth_mb or result["open_pyplot_figures"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
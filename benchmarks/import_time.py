@@ -0,0 +1,89 @@
+"""
+Import-time and rerun benchmark for the Streamlit app.
+
+Measures, in fresh interpreters, how long it takes to import the app's
+entry modules and each screen, then times full script reruns of every page
+with Streamlit's AppTest harness. Results are printed as JSON.
+
+    python -m benchmarks.import_time --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# AppTest runs the real app, which creates, migrates and imports the CSV
+# ledgers into its database; give it a scratch one instead of streamline.db
+os.environ.setdefault("STREAMLINE_DB", os.path.join(tempfile.mkdtemp(prefix="streamline-bench-"), "streamline.db"))
+
+from screen import PAGES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_import(module, repeat):
+    """Median wall time (ms) to import ``module`` in a fresh interpreter."""
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; "
+        "print((time.perf_counter() - start) * 1000)"
+    )
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(float(output.strip().splitlines()[-1]))
+    return round(statistics.median(samples), 1)
+
+
+def time_reruns(page, repeat):
+    """Cold first run and median warm rerun (ms) of the app showing ``page``."""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+    app.session_state["role"] = "AP Specialist"
+
+    start = time.perf_counter()
+    app.run()
+    if page != list(PAGES)[0]:
+        app.sidebar.radio[0].set_value(page)
+        app.run()
+    cold = (time.perf_counter() - start) * 1000
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        app.run()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "first_run_ms": round(cold, 1),
+        "rerun_ms": round(statistics.median(samples), 1),
+        "exceptions": [str(e.value) for e in app.exception],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-reruns", action="store_true", help="Only measure import times")
+    args = parser.parse_args()
+
+    results = {
+        "imports_ms": {
+            module: time_import(module, args.repeat)
+            for module in ["streamlit", "screen", *(module for module, _ in PAGES.values())]
+        }
+    }
+    if not args.skip_reruns:
+        results["reruns"] = {page: time_reruns(page, args.repeat) for page in PAGES}
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+OCR wall time and character accuracy for each preprocessing preset, and
+the fixed per-document cost of each OCR engine.
+
+Runs every preset over the sample invoices in the repository and over
+synthetic invoices, both as clean renders and as simulated phone photos
+(large, tilted, unevenly lit, EXIF-rotated). Accuracy is measured against
+the synthetic invoices' known text; the repository samples have no ground
+truth, so only their timings and text length are reported. Results are
+printed as JSON.
+
+The engine comparison OCRs a blank page (all overhead: process start,
+model load, image hand-over) and small receipts with pytesseract and with
+a persistent tesserocr engine.
+
+    python -m benchmarks.ocr --invoices 5 --presets off,fast,balanced,accurate
+    python -m benchmarks.ocr --engines pytesseract,tesserocr --presets fast
+"""
+import argparse
+import difflib
+import io
+import json
+import os
+import statistics
+import time
+
+from PIL import Image
+
+from benchmarks import synthetic
+from utils.ocr_engine import PytesseractEngine, TesserocrEngine
+from utils.preprocess import PRESETS, preprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES = ["invoice.jpg", "invoice2.webp", os.path.join("uploads", "invoice.webp")]
+
+
+def character_accuracy(reference, text):
+    """1 - (character edits to turn ``text`` into ``reference``) / len(reference), ignoring spacing."""
+    reference, text = " ".join(reference.split()), " ".join(text.split())
+    matcher = difflib.SequenceMatcher(None, reference, text, autojunk=False)
+    errors = sum(max(i2 - i1, j2 - j1) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal")
+    return max(0.0, 1 - errors / max(len(reference), 1))
+
+
+def run(documents, preset, engine=None):
+    """Preprocess (and OCR, given an engine) every (name, bytes, reference) document; return per-document results."""
+    results = []
+    for name, data, reference in documents:
+        start = time.perf_counter()
+        image, config = preprocess(Image.open(io.BytesIO(data)), preset)
+        image.load()
+        prepared = time.perf_counter()
+        result = {
+            "document": name,
+            "preprocess_ms": round((prepared - start) * 1000, 1),
+            "pixels": image.width * image.height,
+        }
+        if engine is not None:
+            text = engine.image_to_string(image, config)
+            result["ocr_ms"] = round((time.perf_counter() - prepared) * 1000, 1)
+            result["chars"] = len(text)
+            if reference is not None:
+                result["accuracy"] = round(character_accuracy(reference, text), 4)
+        result["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        results.append(result)
+    return results
+
+
+def summarize(results):
+    summary = {"documents": len(results)}
+    for key in ("preprocess_ms", "ocr_ms", "total_ms", "accuracy"):
+        values = [result[key] for result in results if key in result]
+        if values:
+            summary[f"median_{key}"] = round(statistics.median(values), 4 if key == "accuracy" else 1)
+    return summary
+
+
+def open_engine(name):
+    """An initialized engine, or the reason it can't be used here."""
+    try:
+        if name == "tesserocr":
+            return TesserocrEngine(), None
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return PytesseractEngine(), None
+    except (ImportError, RuntimeError, EnvironmentError) as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def bench_engine(engine, receipts, repeat):
+    """Median milliseconds per document for a blank page and for small receipts."""
+    blank = Image.new("L", (400, 200), color=255)
+    timings = {}
+    for label, images in (("blank", [blank]), ("receipts", receipts)):
+        samples = []
+        for _ in range(repeat):
+            for image in images:
+                start = time.perf_counter()
+                engine.image_to_string(image, "--psm 6")
+                samples.append((time.perf_counter() - start) * 1000)
+        timings[f"{label}_median_ms"] = round(statistics.median(samples), 1)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--invoices", type=int, default=5, help="Synthetic invoices per variant")
+    parser.add_argument("--presets", default=",".join(PRESETS))
+    parser.add_argument("--engines", default="pytesseract,tesserocr", help="Engines to compare per-document overhead of")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    engines = {name: open_engine(name) for name in args.engines.split(",")}
+    # Presets are compared on the first engine that works
+    engine = next((engine for engine, _ in engines.values() if engine is not None), None)
+
+    invoices = synthetic.make_invoices(args.invoices)
+    scans, photos = [], []
+    for invoice in invoices:
+        number = invoice["invoice_info"]["number"]
+        reference = synthetic.invoice_text(invoice)
+        buffer = io.BytesIO()
+        synthetic.render_invoice(invoice).save(buffer, "PNG")
+        scans.append((number, buffer.getvalue(), reference))
+        photos.append((number, synthetic.photograph(synthetic.render_invoice(invoice)), reference))
+    samples = []
+    for name in SAMPLES:
+        with open(os.path.join(ROOT, name), "rb") as f:
+            samples.append((name, f.read(), None))
+
+    results = {"engine": engine.name if engine else None, "presets": {}, "engines": {}}
+    if engine is None:
+        results["note"] = "No OCR engine available; only preprocessing was timed"
+    for preset in args.presets.split(","):
+        report = {"config": PRESETS[preset]["config"]}
+        for variant, documents in (("samples", samples), ("scans", scans), ("photos", photos)):
+            report[variant] = summarize(run(documents, preset, engine))
+        results["presets"][preset] = report
+
+    # Small receipts: the top of each synthetic invoice, already clean
+    receipts = [synthetic.render_invoice(invoice).crop((0, 0, 620, 300)) for invoice in invoices]
+    for name, (candidate, reason) in engines.items():
+        results["engines"][name] = bench_engine(candidate, receipts, args.repeat) if candidate else {"skipped": reason}
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
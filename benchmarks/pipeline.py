@@ -0,0 +1,391 @@
+"""
+End-to-end benchmark of every pipeline stage on synthetic data.
+
+Invoices are rendered with PIL and Gemini is replaced by a deterministic
+FakeModel, so runs are repeatable and need no network or API key. Ledger
+stages run against CSV ledgers of each requested size, imported into a
+scratch database. Results are printed (or written) as JSON so runs can be
+compared.
+
+    python -m benchmarks.pipeline --sizes 1000,100000,1000000 --output before.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+from benchmarks import synthetic
+
+
+def timed(func, repeat=3):
+    """Run ``func`` ``repeat`` times; return its last result and timings in ms."""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, {
+        "min_ms": round(min(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "repeat": repeat,
+    }
+
+
+def per_item(timing, count):
+    """Add per-item milliseconds to a timing."""
+    timing["items"] = count
+    timing["per_item_ms"] = round(timing["median_ms"] / max(count, 1), 3)
+    return timing
+
+
+def bench_ocr(invoices, repeat):
+    from pytesseract import TesseractNotFoundError
+    from utils.ocr import extract_text_from_image
+
+    images = [synthetic.render_invoice(invoice) for invoice in invoices]
+    try:
+        _, timing = timed(lambda: [extract_text_from_image(image) for image in images], repeat)
+    except TesseractNotFoundError as e:
+        return {"skipped": str(e)}
+    return per_item(timing, len(images))
+
+
+def bench_pages(invoices, page_counts=(1, 10, 50)):
+    """Rasterize and preprocess multi-page TIFFs page by page; peak memory should not grow with pages."""
+    import resource
+    from utils.ocr import iter_pages
+    from utils.preprocess import preprocess
+
+    # Build every document first so their renders don't count towards the peak
+    documents = {pages: synthetic.multipage_tiff(invoices, pages) for pages in page_counts}
+    results = {}
+    for pages, data in documents.items():
+        start = time.perf_counter()
+        for page in iter_pages(data):
+            preprocess(page)
+        elapsed = (time.perf_counter() - start) * 1000
+        results[str(pages)] = {
+            "bytes": len(data),
+            "median_ms": round(elapsed, 3),
+            "per_page_ms": round(elapsed / pages, 3),
+            # ru_maxrss is in KiB on Linux; counts run in increasing order, so growth shows here
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
+    return results
+
+
+def bench_extraction(invoices, repeat):
+    from utils.pipeline import analyze_with_gemini
+    from utils.cache import get_cache
+    from utils.invoice_parser import parse_invoice
+
+    texts = [synthetic.invoice_text(invoice) for invoice in invoices]
+
+    # The first pass misses the response cache (model call + JSON parsing), later passes hit it
+    get_cache().clear()
+    _, cold = timed(lambda: [analyze_with_gemini(text) for text in texts], 1)
+    _, warm = timed(lambda: [analyze_with_gemini(text) for text in texts], repeat)
+    _, parser = timed(lambda: [parse_invoice(text) for text in texts], repeat)
+    return {
+        "analyze_with_gemini_uncached": per_item(cold, len(texts)),
+        "analyze_with_gemini_cached": per_item(warm, len(texts)),
+        "parse_invoice": per_item(parser, len(texts)),
+    }
+
+
+def bench_verification(invoices, goals, model, repeat):
+    from utils.goal_index import clear_goal_indexes
+    from utils.similarity_checker import verify_item_against_goals, verify_items_against_goals
+
+    descriptions = [item["description"] for invoice in invoices for item in invoice["items"]]
+    goal_list = goals["Goals"].tolist()
+
+    clear_goal_indexes()
+    calls = len(model.calls)
+    _, cold = timed(lambda: [verify_item_against_goals(d, goal_list, model) for d in descriptions], 1)
+    cold["model_calls"] = len(model.calls) - calls
+
+    _, warm = timed(lambda: [verify_item_against_goals(d, goal_list, model) for d in descriptions], repeat)
+    _, batched = timed(lambda: verify_items_against_goals(descriptions, goal_list, model), repeat)
+    _, vector = timed(lambda: verify_items_against_goals(descriptions, goal_list, model, engine="vector"), repeat)
+    return {
+        "verify_item_against_goals_uncached": per_item(cold, len(descriptions)),
+        "verify_item_against_goals_cached": per_item(warm, len(descriptions)),
+        "verify_items_against_goals": per_item(batched, len(descriptions)),
+        "verify_items_with_vectors": per_item(vector, len(descriptions)),
+    }
+
+
+def bench_streaming(invoices, goals, latency):
+    """
+    Time to the first verified line and to the whole invoice, with and
+    without streaming the extraction response, against a slow fake model.
+    """
+    from utils import model_client, pipeline
+    from utils.cache import get_cache
+    from utils.pipeline import extract_invoice_data, stream_verify_invoice, verify_invoice
+    from utils.variation_store import get_variation_store
+
+    previous = model_client.get_model(), pipeline.CONFIDENCE_THRESHOLD
+    model_client.set_model(synthetic.fake_model(invoices, latency=latency))
+    # Synthetic invoices are easy for the local parser; measure the model path
+    pipeline.CONFIDENCE_THRESHOLD = float("inf")
+    texts = [synthetic.invoice_text(invoice) for invoice in invoices]
+
+    def reset():
+        # Every run extracts with the model and fetches item variations again
+        get_cache().clear()
+        get_variation_store().invalidate()
+
+    def batch(text):
+        start = time.perf_counter()
+        verify_invoice(extract_invoice_data(text), goals)
+        elapsed = (time.perf_counter() - start) * 1000
+        return elapsed, elapsed
+
+    def streamed(text):
+        start = time.perf_counter()
+        first = []
+        stream_verify_invoice(text, goals, on_item=lambda row, messages: first.append(time.perf_counter()))
+        return (first[0] - start) * 1000, (time.perf_counter() - start) * 1000
+
+    results = {"latency_s": latency}
+    try:
+        for name, run in (("batch", batch), ("streamed", streamed)):
+            samples = []
+            for text in texts:
+                reset()
+                samples.append(run(text))
+            results[name] = {
+                "first_row_median_ms": round(statistics.median(first for first, _ in samples), 3),
+                "total_median_ms": round(statistics.median(total for _, total in samples), 3),
+                "items": sum(len(invoice["items"]) for invoice in invoices),
+            }
+    finally:
+        model_client.set_model(previous[0])
+        pipeline.CONFIDENCE_THRESHOLD = previous[1]
+    return results
+
+
+def bench_model_client(rate=20, seconds=3.0, threads=16):
+    """
+    Throughput of many threads calling a model with a ``rate`` requests per
+    second quota, bare and through ResilientModel, plus single-flight
+    coalescing of identical concurrent prompts.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from utils.model_client import ResilientModel
+
+    def hammer(model):
+        counts = {"ok": 0, "failed": 0}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def worker(n):
+            i = 0
+            while time.perf_counter() < deadline:
+                try:
+                    model.generate_content(f"prompt {n}-{i}")
+                    outcome = "ok"
+                except Exception:
+                    outcome = "failed"
+                with lock:
+                    counts[outcome] += 1
+                i += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(worker, range(threads)))
+        elapsed = time.perf_counter() - start
+        return {
+            "ok_per_s": round(counts["ok"] / elapsed, 1),
+            "failed": counts["failed"],
+            "quota_per_s": rate,
+        }
+
+    results = {
+        "bare": hammer(synthetic.quota_model(rate)),
+        "resilient": hammer(ResilientModel(synthetic.quota_model(rate), rpm=rate * 60)),
+    }
+
+    fake = synthetic.quota_model(rate, latency=0.2)
+    model = ResilientModel(fake, rpm=0)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: model.generate_content("same prompt"), range(threads)))
+    results["single_flight"] = {"concurrent_callers": threads, "model_calls": len(fake.calls)}
+    return results
+
+
+def bench_frames(repeat):
+    """Memory and groupby/filter time of the full ledger frames, untyped and with each dtype backend."""
+    from utils import schema, storage
+
+    with storage.connect() as conn:
+        raw = {
+            "invoices": (storage._select(conn, "invoices", storage.INVOICE_COLUMNS), schema.INVOICE_SCHEMA),
+            "accounts_payable": (storage._select(conn, storage.AP_TABLE, storage.AP_COLUMNS), schema.AP_SCHEMA),
+        }
+
+    results = {}
+    for name, (df, frame_schema) in raw.items():
+        frames = {"object": df}
+        for backend in ("numpy", "pyarrow"):
+            frames[backend] = schema.apply_schema(df.copy(), frame_schema, backend)
+
+        results[name] = {}
+        for backend, frame in frames.items():
+            def group_and_filter():
+                verified = frame[schema.to_flags(frame["Verified"]).fillna(False)]
+                return verified.groupby("Category", observed=True)["Total"].sum()
+            _, timing = timed(group_and_filter, repeat)
+            timing["memory_mb"] = round(frame.memory_usage(deep=True).sum() / 2**20, 2)
+            results[name][backend] = timing
+    return results
+
+
+def bench_ledger(rows, directory, repeat):
+    """Accounts payable and expenditure analysis stages for a ledger of ``rows`` lines."""
+    from utils import storage
+    from utils.dates import parse_dates
+
+    invoices, ap = synthetic.make_ledger(rows)
+    os.makedirs(directory, exist_ok=True)
+    invoices.to_csv(os.path.join(directory, storage.INVOICE_CSV), index=False)
+    ap.to_csv(os.path.join(directory, storage.AP_CSV), index=False)
+    synthetic.make_goals().to_csv(os.path.join(directory, storage.GOALS_CSV), index=False)
+
+    results = {}
+    _, results["read_csv"] = timed(lambda: pd.read_csv(os.path.join(directory, storage.INVOICE_CSV)), 1)
+
+    def parse_and_flag():
+        due = parse_dates(invoices["Due Date"])
+        return due < pd.Timestamp.today().normalize()
+    _, results["parse_due_dates_and_overdue"] = timed(parse_and_flag, repeat)
+
+    # The first connection creates the schema and imports the CSVs found in the working directory
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        storage.DB_PATH = os.path.join(directory, "streamline.db")
+
+        def import_ledger():
+            with storage.connect():
+                pass
+        _, results["db_import"] = timed(import_ledger, 1)
+
+        # Queries are timed uncached; "_cached" entries are later reruns served by the read cache
+        ap_results = {}
+        _, ap_results["summary"] = timed(storage.accounts_payable_summary.__wrapped__, repeat)
+        _, ap_results["count_overdue"] = timed(lambda: storage.count_accounts_payable.__wrapped__(overdue=True), repeat)
+        _, ap_results["list_categories"] = timed(storage.list_categories.__wrapped__, repeat)
+        offset = max(0, rows // 2 - 25)
+        _, ap_results["query_page"] = timed(
+            lambda: storage.query_accounts_payable.__wrapped__(overdue=True, limit=50, offset=offset), repeat
+        )
+
+        def rerun():
+            storage.accounts_payable_summary()
+            storage.list_categories()
+            storage.count_accounts_payable(overdue=True)
+            return storage.query_accounts_payable(overdue=True, limit=50, offset=offset)
+        rerun()
+        _, ap_results["page_rerun_cached"] = timed(rerun, repeat)
+        results["accounts_payable"] = ap_results
+
+        results["frames"] = bench_frames(repeat)
+
+        ex_results = {}
+
+        def rebuild():
+            with storage.connect() as conn:
+                storage.rebuild_rollups(conn)
+        _, ex_results["rebuild_rollups"] = timed(rebuild, 1)
+        rollup, ex_results["read_rollup"] = timed(storage.read_expenditure_rollup.__wrapped__, repeat)
+        storage.read_expenditure_rollup()
+        _, ex_results["read_rollup_cached"] = timed(storage.read_expenditure_rollup, repeat)
+
+        def aggregate():
+            df = rollup[rollup["Month"] != ""]
+            monthly = df.pivot_table(
+                index="Month", columns="Category", values="Total", aggfunc="sum", observed=True
+            ).fillna(0)
+            return monthly, df.groupby("Month", observed=True)["Total"].sum()
+        _, ex_results["aggregate"] = timed(aggregate, repeat)
+
+        # The same aggregation computed from the raw ledger, for comparison
+        def aggregate_raw():
+            df = invoices.assign(Month=parse_dates(invoices["Due Date"]).dt.to_period("M"))
+            return df.pivot_table(index="Month", columns="Category", values="Total", aggfunc="sum").fillna(0)
+        _, ex_results["aggregate_from_ledger"] = timed(aggregate_raw, repeat)
+        results["expenditure_analysis"] = ex_results
+    finally:
+        os.chdir(cwd)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="Comma-separated ledger sizes")
+    parser.add_argument("--invoices", type=int, default=20, help="Synthetic invoices for the OCR/extraction stages")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stages", default="ocr,pages,extraction,verification,streaming,client,ledger")
+    parser.add_argument("--latency", type=float, default=1.0, help="Simulated model latency (s) for the streaming stage")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+    stages = set(args.stages.split(","))
+
+    # Caches and databases live in a scratch directory, so every run starts cold
+    workdir = tempfile.mkdtemp(prefix="streamline-bench-")
+    os.environ["STREAMLINE_CACHE_DIR"] = os.path.join(workdir, "cache")
+    os.environ["STREAMLINE_VARIATION_DB"] = os.path.join(workdir, "variations.db")
+    os.environ["STREAMLINE_DB"] = os.path.join(workdir, "streamline.db")
+    os.environ["STREAMLINE_TRACE_LOG"] = os.path.join(workdir, "traces.jsonl")
+
+    from utils import model_client
+
+    invoices = synthetic.make_invoices(args.invoices)
+    model = synthetic.fake_model(invoices)
+    model_client.set_model(model)
+
+    results = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "invoices": args.invoices,
+        "repeat": args.repeat,
+        "stages": {},
+    }
+    if "ocr" in stages:
+        results["stages"]["ocr"] = bench_ocr(invoices, args.repeat)
+    if "pages" in stages:
+        results["stages"]["pages"] = bench_pages(invoices)
+    if "extraction" in stages:
+        results["stages"]["extraction"] = bench_extraction(invoices, args.repeat)
+    if "verification" in stages:
+        results["stages"]["verification"] = bench_verification(invoices, synthetic.make_goals(), model, args.repeat)
+    if "streaming" in stages:
+        results["stages"]["streaming"] = bench_streaming(invoices[:5], synthetic.make_goals(), args.latency)
+    if "client" in stages:
+        results["stages"]["client"] = bench_model_client()
+    if "ledger" in stages:
+        results["stages"]["ledger"] = {
+            str(rows): bench_ledger(int(rows), os.path.join(workdir, f"ledger-{rows}"), args.repeat)
+            for rows in args.sizes.split(",")
+        }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Deterministic synthetic data for the benchmarks: invoices (as extraction
+results, plain text and rendered images), CSV ledgers, company goals and a
+scripted stand-in for Gemini.
+"""
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from PIL import Image, ImageDraw, ImageFont
+
+# Benchmarks run the instrumented pipeline; keep their spans out of the
+# production trace log the Performance page reads
+os.environ.setdefault("STREAMLINE_TRACE_LOG", os.path.join(tempfile.gettempdir(), "streamline-bench-traces.jsonl"))
+
+from utils.fake_model import FakeModel
+
+VENDORS = ["Acme Office Supply", "Northwind Traders", "Globex Hardware", "Initech Services", "Umbrella Prints"]
+
+PRODUCTS = {
+    "Office Supplies": ["A4 copy paper", "Ballpoint pens", "Stapler", "Sticky notes", "Printer toner"],
+    "Electronics": ["Laptop", "USB-C dock", "27 inch monitor", "Wireless mouse", "Mechanical keyboard"],
+    "Apparel": ["T-shirts", "Hoodies", "Safety vests", "Caps", "Polo shirts"],
+    "Services": ["Wedding photos", "Cleaning service", "IT support hours", "Catering", "Courier delivery"],
+    "Furniture": ["Office chair", "Standing desk", "Filing cabinet", "Bookshelf", "Meeting table"],
+}
+
+CATEGORIES = list(PRODUCTS)
+DEPARTMENTS = ["HR", "IT", "Finance", "Operations", None]
+
+# Due dates in the legacy CSVs come in several formats
+LEDGER_DATE_FORMATS = ["%d.%m.%Y", "%Y-%m-%d", "%m/%d/%Y", "%d-%m-%Y", "%B %d, %Y"]
+
+INVOICE_NUMBER_RE = re.compile(r"Invoice Number:\s*(\S+)")
+
+
+def make_invoice(rng, number):
+    """One invoice in the extraction schema returned by ``analyze_with_gemini``."""
+    issued = date(2024, 1, 1) + timedelta(days=int(rng.integers(0, 600)))
+    items = []
+    for _ in range(int(rng.integers(1, 8))):
+        category = CATEGORIES[int(rng.integers(len(CATEGORIES)))]
+        quantity = int(rng.integers(1, 20))
+        price = round(float(rng.uniform(1, 500)), 2)
+        items.append({
+            "description": PRODUCTS[category][int(rng.integers(5))],
+            "quantity": quantity,
+            "price": price,
+            "total": round(quantity * price, 2),
+            "category": category,
+        })
+    subtotal = round(sum(item["total"] for item in items), 2)
+    tax = round(subtotal * 0.08, 2)
+    return {
+        "vendor": VENDORS[int(rng.integers(len(VENDORS)))],
+        "invoice_info": {"number": f"INV-{number:06d}", "date": issued.strftime("%d.%m.%Y")},
+        "items": items,
+        "summary": {"subtotal": subtotal, "tax": tax, "total": round(subtotal + tax, 2)},
+    }
+
+
+def make_invoices(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [make_invoice(rng, number) for number in range(1, count + 1)]
+
+
+def invoice_lines(invoice):
+    """The invoice laid out as the lines of a printed document."""
+    lines = [
+        invoice["vendor"],
+        f"Invoice Number: {invoice['invoice_info']['number']}",
+        f"Invoice Date: {invoice['invoice_info']['date']}",
+        "",
+        "Description                    Qty      Price      Total",
+    ]
+    for item in invoice["items"]:
+        lines.append(f"{item['description']:<28} {item['quantity']:>5} {item['price']:>10.2f} {item['total']:>10.2f}")
+    summary = invoice["summary"]
+    lines += [
+        "",
+        f"Subtotal: {summary['subtotal']:.2f}",
+        f"Tax (8%): {summary['tax']:.2f}",
+        f"Total: {summary['total']:.2f}",
+    ]
+    return lines
+
+
+def invoice_text(invoice):
+    return "\n".join(invoice_lines(invoice))
+
+
+def render_invoice(invoice, width=1240, line_height=36):
+    """Render the invoice as a white page with black text, like a scanned document."""
+    try:
+        font = ImageFont.load_default(size=24)
+    except TypeError:  # Pillow < 10.1 has a single bitmap font
+        font = ImageFont.load_default()
+    lines = invoice_lines(invoice)
+    image = Image.new("L", (width, 120 + line_height * len(lines)), color=255)
+    draw = ImageDraw.Draw(image)
+    for row, line in enumerate(lines):
+        draw.text((60, 60 + row * line_height), line, fill=0, font=font)
+    return image
+
+
+def photograph(image, seed=0, scale=3.0, angle=2.0):
+    """
+    A rendered page as a phone would capture it: enlarged to camera
+    resolution, tilted, unevenly lit and noisy, saved as a JPEG that is
+    stored sideways with an EXIF orientation tag. Returns the JPEG bytes.
+    """
+    rng = np.random.default_rng(seed)
+    photo = image.convert("L").resize((round(image.width * scale), round(image.height * scale)), Image.Resampling.BICUBIC)
+    photo = photo.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=255)
+
+    pixels = np.asarray(photo, dtype=np.float32)
+    # Light falls off towards one corner
+    shade = np.linspace(1.0, 0.7, pixels.shape[1])[None, :] * np.linspace(1.0, 0.85, pixels.shape[0])[:, None]
+    pixels = pixels * shade + rng.normal(0, 12, pixels.shape)
+    photo = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: the viewer rotates the stored image 90° clockwise
+    buffer = io.BytesIO()
+    photo.transpose(Image.Transpose.ROTATE_90).save(buffer, "JPEG", quality=85, exif=exif)
+    return buffer.getvalue()
+
+
+def multipage_tiff(invoices, pages):
+    """A ``pages``-page TIFF of rendered invoices (cycled), as a multi-page scan would arrive."""
+    renders = [render_invoice(invoice) for invoice in invoices[:pages]]
+    frames = [renders[i % len(renders)] for i in range(pages)]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, "TIFF", save_all=True, append_images=frames[1:], compression="tiff_deflate", dpi=(150, 150))
+    return buffer.getvalue()
+
+
+def make_ledger(rows, seed=0):
+    """
+    A ledger in the layout of invoice_data.csv, plus the matching ap.csv.
+
+    Due dates are spread over two years around today in mixed formats, so
+    date parsing and overdue checks see realistic data.
+    """
+    rng = np.random.default_rng(seed)
+    category_codes = rng.integers(len(CATEGORIES), size=rows)
+    products = np.array([PRODUCTS[category] for category in CATEGORIES], dtype=object)
+    quantity = rng.integers(1, 20, size=rows)
+    price = np.round(rng.uniform(1, 500, size=rows), 2)
+    total = np.round(quantity * price * 1.08, 2)
+    due = pd.Timestamp.today().normalize() + pd.to_timedelta(rng.integers(-365, 365, size=rows), unit="D")
+
+    # Format each date with one of the legacy formats
+    formats = rng.integers(len(LEDGER_DATE_FORMATS), size=rows)
+    due_dates = np.empty(rows, dtype=object)
+    for position, fmt in enumerate(LEDGER_DATE_FORMATS):
+        mask = formats == position
+        due_dates[mask] = due[mask].strftime(fmt)
+
+    invoices = pd.DataFrame({
+        "Invoice Number": [f"INV-{number:07d}" for number in rng.integers(1, max(2, rows // 3), size=rows)],
+        "Due Date": due_dates,
+        "Description": products[category_codes, rng.integers(products.shape[1], size=rows)],
+        "Quantity": quantity,
+        "Price": price,
+        "Subtotal": np.round(quantity * price, 2),
+        "Tax": np.round(quantity * price * 0.08, 2),
+        "Total": total,
+        "Category": np.array(CATEGORIES, dtype=object)[category_codes],
+        "Verified": rng.random(rows) < 0.7,
+        "Department": np.array(DEPARTMENTS, dtype=object)[rng.integers(len(DEPARTMENTS), size=rows)],
+    })
+    ap = invoices[["Invoice Number", "Due Date", "Price", "Total", "Category", "Verified"]].copy()
+    ap["Payment Status"] = np.array(["Pending", "Successful", "Failed"])[rng.choice(3, size=rows, p=[0.6, 0.35, 0.05])]
+    return invoices, ap
+
+
+def make_goals(count=25):
+    """Company goals in the layout of company_goals.csv."""
+    names = [product for products in PRODUCTS.values() for product in products]
+    return pd.DataFrame({
+        "Goals": names[:count],
+        "Outcomes": [f"{100 + i} {name} delivered" for i, name in enumerate(names[:count])],
+        "Due Date": ["2025-12-31"] * min(count, len(names)),
+        "Key Results": [""] * min(count, len(names)),
+        "Number of Items": [100 + i for i in range(min(count, len(names)))],
+    })
+
+
+def variations_for(item):
+    """Deterministic "alternative names" for an item."""
+    words = item.lower().split()
+    return [item.lower(), " ".join(reversed(words)), f"{item.lower()} pack", words[-1] if words else item]
+
+
+def fake_model(invoices=(), latency=0.0):
+    """
+    A FakeModel answering the prompts Streamline sends to Gemini.
+
+    Extraction prompts are answered with the matching synthetic invoice,
+    variation prompts (batched or single) with ``variations_for``.
+    """
+    by_number = {invoice["invoice_info"]["number"]: invoice for invoice in invoices}
+
+    def respond(prompt):
+        match = INVOICE_NUMBER_RE.search(prompt)
+        if "invoice analysis expert" in prompt and match:
+            invoice = {key: value for key, value in by_number[match.group(1)].items() if key != "vendor"}
+            return "```json\n" + json.dumps(invoice, indent=2) + "\n```"
+        if "Items:" in prompt:
+            items = json.loads(prompt.split("Items:", 1)[1].strip())
+            return json.dumps({item: variations_for(item) for item in items})
+        match = re.search(r"descriptions for '(.*)' as a comma", prompt)
+        if match:
+            return ", ".join(variations_for(match.group(1)))
+        return ""
+
+    return FakeModel(respond, latency=latency, model_name="fake-benchmark-model")
+
+
+class QuotaExceeded(Exception):
+    """What a FakeModel over its quota raises, like Gemini's 429 ResourceExhausted."""
+    code = 429
+
+
+def quota_model(rate, latency=0.05):
+    """A FakeModel that answers ``rate`` requests per second and rejects any more with QuotaExceeded."""
+    accepted = deque()
+    lock = threading.Lock()
+
+    def respond(prompt):
+        with lock:
+            now = time.monotonic()
+            while accepted and now - accepted[0] >= 1.0:
+                accepted.popleft()
+            if len(accepted) >= rate:
+                raise QuotaExceeded("429 Resource has been exhausted")
+            accepted.append(now)
+        return "ok"
+
+    return FakeModel(respond, latency=latency, model_name="fake-quota-model")
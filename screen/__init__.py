@@ -0,0 +1,16 @@
+import importlib
+
+# Navigation label -> (module, page function). Modules are imported on first use.
+PAGES = {
+    "Create Company Goals": ("screen.company_goals", "company_goals"),
+    "Upload Invoices": ("screen.upload_invoice", "upload_invoice"),
+    "Accounts Payable": ("screen.accounts_payable", "accounts_payable"),
+    "Company Expenditure Analysis": ("screen.expenditure_analysis", "expenditure_analysis"),
+    "Performance": ("screen.performance", "performance"),
+}
+
+
+def load_page(name):
+    """Import the module behind a page and return its page function."""
+    module_name, function_name = PAGES[name]
+    return getattr(importlib.import_module(module_name), function_name)
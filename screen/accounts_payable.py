@@ -1,142 +1,85 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-from datetime import datetime
+from utils import storage
+from utils.charts import render_chart
+from utils.payments import get_payment_engine
 
-
-def parse_date(date_str):
-    """Parse date string into datetime object, handling different formats."""
-    date_formats = [
-        "%Y-%m-%d",    # 2024-07-19
-        "%d.%m.%Y",    # 19.07.2024
-        "%m/%d/%y",    # 7/19/24
-        "%d/%m/%y",    # 19/07/24
-        "%Y/%m/%d",    # 2024/07/19
-        "%m-%d-%y",    # 7-19-24
-        "%d-%m-%y",    # 19-07-24
-        "%m/%d/%Y",    # 7/19/2024
-        "%d/%m/%Y"     # 19/07/2024
-    ]
-    
-    for fmt in date_formats:
-        try:
-            return datetime.strptime(date_str.strip(), fmt)
-        except ValueError:
-            continue
-            
-    # If no format matches, try to standardize the date string
-    try:
-        # Remove any leading/trailing whitespace and handle missing century
-        clean_date = date_str.strip()
-        if len(clean_date) <= 8:  # Short format like 7/19/24
-            # Assume 20xx for year
-            parts = clean_date.replace('-', '/').split('/')
-            if len(parts) == 3:
-                month, day, year = parts
-                if len(year) == 2:
-                    year = '20' + year
-                return datetime.strptime(f"{month}/{day}/{year}", "%m/%d/%Y")
-    except:
-        pass
-        
-    raise ValueError(f"time data '{date_str}' does not match any known format")
+PAGE_SIZES = [25, 50, 100]
 
 
 def accounts_payable():
     st.title("Accounts Payable")
 
-    # Load or create ap.csv with error handling
-    try:
-        ap_df = pd.read_csv("ap.csv")
-    except (FileNotFoundError, pd.errors.EmptyDataError):
-        ap_df = pd.DataFrame()
-    except pd.errors.ParserError:
-        st.error("Error reading ap.csv - file may be corrupted")
-        ap_df = pd.DataFrame()
-
-    # Load invoice data with error handling
-    try:
-        invoice_df = pd.read_csv("invoice_data.csv")
-        # Ensure required columns exist
-        required_columns = ["Invoice Number", "Due Date", "Price", "Total", "Category", "Verified"]
-        for col in required_columns:
-            if col not in invoice_df.columns:
-                invoice_df[col] = None
-    except (FileNotFoundError, pd.errors.EmptyDataError):
-        invoice_df = pd.DataFrame(columns=required_columns)
-    except pd.errors.ParserError:
-        st.error("Error reading invoice_data.csv - file may be corrupted")
-        invoice_df = pd.DataFrame(columns=required_columns)
-
-    # Select necessary columns
-    selected_columns = ["Invoice Number", "Due Date", "Price", "Total", "Category", "Verified"]
-    df = invoice_df[selected_columns].copy()
-
-    # Add Payment Overdue column
-    df["Payment Overdue"] = df["Due Date"].apply(lambda x: "Yes" if parse_date(x) < datetime.now() else "No")
-
-    # Add Payment Status column
-    df["Payment Status"] = "Pending"
-
-    # Display summary and pie chart
+    # Display summary and pie chart from aggregate queries
     st.write("### Overview")
     summary_cols = st.columns([1, 2])
+    summary = storage.accounts_payable_summary()
 
     # Left column: Summary stats
-    total_invoices = df.shape[0]
-    overdue_count = df[df["Payment Overdue"] == "Yes"].shape[0]
+    overdue_count = summary["overdue"]
     with summary_cols[0]:
-        st.metric("Total Invoices", total_invoices)
+        st.metric("Total Invoices", summary["total"])
         st.metric("Overdue Payments", overdue_count)
 
-    # Right column: Pie chart
-    successful_count = df[df["Payment Status"] == "Successful"].shape[0]
-    labels = ['Failed Payments', 'Successful Payments']
-    sizes = [overdue_count, successful_count]
-    colors = ['#FF6B6B', '#6BCB77']
-
-    fig, ax = plt.subplots()
-    ax.pie(sizes, labels=labels, autopct='%1.1f%%', colors=colors, startangle=90)
-    ax.axis('equal')  # Equal aspect ratio ensures the pie chart is circular.
+    # Right column: Pie chart of payment statuses (overdue is counted on the left)
+    successful_count = summary["statuses"].get("Successful", 0)
+    failed_count = summary["statuses"].get("Failed", 0)
+    labels = ['Successful Payments', 'Failed Payments', 'Not Yet Paid']
+    sizes = pd.Series([successful_count, failed_count, summary["total"] - successful_count - failed_count], index=labels)
+    colors = ['#6BCB77', '#FF6B6B', '#FFD93D']
 
     with summary_cols[1]:
-        st.pyplot(fig)
+        if sizes.sum():
+            st.image(render_chart("pie", sizes, figsize=(6.4, 4.8), colors=colors, title="Payment Status"))
 
-    # Display data in separate columns with buttons
     st.write("### Accounts Payable Overview")
-    # Header row
-    header_cols = st.columns([1, 1, 1, 1, 1, 1, 1, 1])
-    headers = ["Invoice Number", "Due Date", "Price", "Total", "Category", "Verified", "Payment Overdue", "Actions"]
-    for col, header in zip(header_cols, headers):
-        col.markdown(f"**{header}**")
-
-    for idx, row in df.iterrows():
-        cols = st.columns([1, 1, 1, 1, 1, 1, 1, 1])
-        cols[0].write(row["Invoice Number"])
-        cols[1].write(row["Due Date"])
-        cols[2].write(row["Price"])
-        cols[3].write(row["Total"])
-        cols[4].write(row["Category"])
-        cols[5].write(row["Verified"])
-        cols[6].write(f"Overdue: {'🔴' if row['Payment Overdue'] == 'Yes' else '🟢'}")
-        if cols[7].button(f"Pay Now", key=f"pay_{idx}"):
-            with st.spinner(f"Processing Payment for Invoice {row['Invoice Number']}"):
-                st.write("Processing payment...")
-                # Simulate payment process
-                payment_success = True  # Replace with actual payment logic
-                if payment_success:
-                    st.success("Payment Successful!")
-                    df.at[idx, "Payment Status"] = "Successful"
-                else:
-                    st.error("Payment Failed!")
-                    df.at[idx, "Payment Status"] = "Failed"
-
-    # Save button to write to ap.csv
-    if st.button("Save Changes"):
-        df.to_csv("ap.csv", index=False)
-        st.success("Changes saved to ap.csv")
 
-    # Display existing ap.csv data
-    if not ap_df.empty:
-        st.write("### Existing Accounts Payable Data")
-        st.dataframe(ap_df, use_container_width=True)
+    # Filters are applied in the database so only the visible page is loaded
+    filter_cols = st.columns(4)
+    overdue = filter_cols[0].selectbox("Overdue", ["All", "Overdue", "Not overdue"])
+    category = filter_cols[1].selectbox("Category", ["All"] + storage.list_categories())
+    verified = filter_cols[2].selectbox("Verified", ["All", "Verified", "Not verified"])
+    page_size = filter_cols[3].selectbox("Rows per page", PAGE_SIZES)
+
+    filters = {
+        "overdue": None if overdue == "All" else overdue == "Overdue",
+        "category": None if category == "All" else category,
+        "verified": None if verified == "All" else verified == "Verified",
+    }
+    row_count = storage.count_accounts_payable(**filters)
+    page_count = max(1, -(-row_count // page_size))
+    page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1)
+
+    df = storage.query_accounts_payable(**filters, limit=page_size, offset=(page - 1) * page_size)
+    df.insert(0, "Select", False)
+
+    edited = st.data_editor(
+        df,
+        column_config={
+            "Select": st.column_config.CheckboxColumn("Select", help="Select rows for bulk payment"),
+            "Id": None,
+            "Payment Overdue": st.column_config.CheckboxColumn("Payment Overdue"),
+        },
+        disabled=[column for column in df.columns if column != "Select"],
+        hide_index=True,
+        use_container_width=True,
+        key=f"ap_grid_{page}_{page_size}_{overdue}_{category}_{verified}"
+    )
+    selected = edited.loc[edited["Select"], ["Id", "Invoice Number"]]
+    st.caption(f"Showing {len(df)} of {row_count} invoices, {len(selected)} selected")
+
+    # Payments run in the background; their state is persisted as they progress
+    engine = get_payment_engine()
+    action_cols = st.columns([1, 1, 4])
+    if action_cols[0].button(f"Pay Selected ({len(selected)})", disabled=selected.empty):
+        queued = engine.submit(selected["Id"].tolist())
+        st.success(f"Queued {queued} payment(s). Already paid or in-progress invoices were skipped.")
+    action_cols[1].button("Refresh")
+
+    payment_states = storage.payment_summary()
+    if payment_states:
+        with action_cols[2]:
+            st.caption(
+                "Payments: " + ", ".join(f"{state} {count}" for state, count in sorted(payment_states.items()))
+                + f" ({engine.pending_count()} in progress)"
+            )
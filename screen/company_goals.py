@@ -1,40 +1,25 @@
 import streamlit as st
-import pandas as pd
-import requests, os
-import google.generativeai as genai
-from dotenv import load_dotenv
-from datetime import datetime, timedelta
-
-# Load environment variables
-load_dotenv()
-
-# Configure Gemini API
-GOOGLE_API_KEY = os.getenv('GEMINI_API_KEY')
-if not GOOGLE_API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in environment variables")
-
-genai.configure(api_key=GOOGLE_API_KEY)
-model = genai.GenerativeModel('gemini-1.5-pro')
+from datetime import datetime
+from utils.similarity_checker import get_item_variations
+from utils.goal_index import clear_goal_indexes
+from utils.vector_matcher import clear_vector_matchers
+from utils import storage
+from utils.model_client import get_model
+from utils.dates import GOAL_DATE_FORMATS, parse_date
+from utils.tracing import record_usage, span
 
 def format_date(date_str):
     """Convert any date string to DD-MM-YYYY format."""
     try:
-        # Try different date formats and convert to desired format
-        date_formats = [
-            "%d-%m-%Y", "%d/%m/%Y", "%Y-%m-%d", "%Y/%m/%d",
-            "%d-%m-%y", "%d/%m/%y", "%y-%m-%d", "%y/%m/%d"
-        ]
-        
-        for fmt in date_formats:
-            try:
-                date_obj = datetime.strptime(date_str.strip(), fmt)
-                return date_obj.strftime("%d-%m-%Y")
-            except ValueError:
-                continue
+        parsed = parse_date(date_str, GOAL_DATE_FORMATS)
+        if parsed:
+            return parsed.strftime("%d-%m-%Y")
                 
         # If no format matches, try to extract date parts using Gemini
         prompt = f"Extract day, month, and year from this text and return in DD-MM-YYYY format: {date_str}"
-        response = model.generate_content(prompt)
+        with span("goal.format_date", bytes=len(prompt)) as s:
+            response = get_model().generate_content(prompt)
+            record_usage(s, response)
         formatted_date = response.text.strip()
         
         # Validate the formatted date
@@ -53,7 +38,9 @@ def parse_product_info(text):
     Return in format: name|quantity
     Example: "500 computers" should return: computers|500
     """
-    response = model.generate_content(prompt)
+    with span("goal.parse", bytes=len(prompt)) as s:
+        response = get_model().generate_content(prompt)
+        record_usage(s, response)
     parts = response.text.strip().split('|')
     if len(parts) == 2:
         name = parts[0].strip()
@@ -64,41 +51,36 @@ def parse_product_info(text):
         return name, quantity
     return "Unknown", 0
 
-def insert_to_csv(data):
-    """Insert data to CSV file."""
+def save_goal(data):
+    """Save a goal to the database."""
     try:
-        # Extract product name and quantity
-        product_name, number_of_items = parse_product_info(data[0])
+        with span("goal.save"):
+            # Extract product name and quantity
+            product_name, number_of_items = parse_product_info(data[0])
 
-        # Format the data
-        formatted_data = {
-            "Goals": product_name,  # Product name without quantity
-            "Number of Items": number_of_items,
-            "Outcomes": data[1],
-            "Due Date": format_date(data[2]),
-            "Key Results": "NA"  # Default value
-        }
-        
-        # Check if file exists
-        if os.path.exists("company_goals.csv"):
-            existing_df = pd.read_csv("company_goals.csv")
-            new_df = pd.DataFrame([formatted_data], columns=["Goals", "Number of Items", "Outcomes", "Due Date", "Key Results"])
-            updated_df = pd.concat([existing_df, new_df], ignore_index=True)
-        else:
-            updated_df = pd.DataFrame([formatted_data], columns=["Goals", "Number of Items", "Outcomes", "Due Date", "Key Results"])
-        
-        # Save to CSV
-        updated_df.to_csv("company_goals.csv", index=False)
+            # Precompute goal-side variations so the goal index never has to call the model
+            get_item_variations(product_name.lower().strip(), get_model())
+
+            # Format the data
+            formatted_data = {
+                "Goals": product_name,  # Product name without quantity
+                "Number of Items": number_of_items,
+                "Outcomes": data[1],
+                "Due Date": format_date(data[2]),
+                "Key Results": "NA"  # Default value
+            }
+
+            storage.insert_goal(formatted_data)
+            clear_goal_indexes()
+            clear_vector_matchers()
         return True, formatted_data
     except Exception as e:
-        st.error(f"Error saving to CSV: {str(e)}")
+        st.error(f"Error saving goal: {str(e)}")
         return False, None
 
-def read_from_csv():
-    """Read data from CSV file."""
-    # Read data from CSV
-    df = pd.read_csv("company_goals.csv")
-    return df
+def read_goals():
+    """Read all goals from the database."""
+    return storage.read_goals()
 
 def company_goals():
     st.title("Create Company Goals")
@@ -120,14 +102,14 @@ def company_goals():
             Example: 500 computers | Increased inventory | 31-12-2024
             """
             
-            response = model.generate_content(prompt)
+            response = get_model().generate_content(prompt)
             goals = response.text.strip()
 
             # Split the response and clean the data
             goals_list = [goal.strip() for goal in goals.split('|') if goal.strip()]
             
             if len(goals_list) >= 3:  # We only need 3 fields now
-                success, formatted_data = insert_to_csv(goals_list)
+                success, formatted_data = save_goal(goals_list)
                 if success:
                     st.success("Goal added successfully!")
                     
@@ -150,22 +132,19 @@ def company_goals():
     
     # Display existing goals
     st.header("Existing Company Goals")
-    try:
-        existing_goals = read_from_csv()
-        if not existing_goals.empty:
-            st.dataframe(
-                existing_goals,
-                use_container_width=True,
-                hide_index=True,
-                column_config={
-                    "Goals": st.column_config.TextColumn("Goals", width="medium"),
-                    "Number of Items": st.column_config.NumberColumn("Number of Items", width="small"),
-                    "Outcomes": st.column_config.TextColumn("Outcomes", width="medium"),
-                    "Due Date": st.column_config.TextColumn("Due Date", width="small"),
-                    "Key Results": st.column_config.TextColumn("Key Results", width="medium")
-                }
-            )
-        else:
-            st.info("No existing goals found.")
-    except FileNotFoundError:
-        st.info("No goals have been created yet.")
+    existing_goals = read_goals()
+    if not existing_goals.empty:
+        st.dataframe(
+            existing_goals,
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "Goals": st.column_config.TextColumn("Goals", width="medium"),
+                "Number of Items": st.column_config.NumberColumn("Number of Items", width="small"),
+                "Outcomes": st.column_config.TextColumn("Outcomes", width="medium"),
+                "Due Date": st.column_config.TextColumn("Due Date", width="small"),
+                "Key Results": st.column_config.TextColumn("Key Results", width="medium")
+            }
+        )
+    else:
+        st.info("No existing goals found.")
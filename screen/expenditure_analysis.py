@@ -1,52 +1,45 @@
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
+from utils import storage
+from utils.charts import render_chart
 
 def expenditure_analysis():
     st.title("Company Expenditure Analysis")
 
-    # Load ap.csv
-    try:
-        df = pd.read_csv("ap.csv", parse_dates=["Due Date"])
-    except FileNotFoundError:
-        st.error("ap.csv file not found.")
-        return
-
-    # Ensure 'Due Date' is in datetime format
-    df["Due Date"] = pd.to_datetime(df["Due Date"], errors='coerce')
-
-    # Extract month and year for grouping
-    df["Month"] = df["Due Date"].dt.to_period("M")
-
     # Create 2 columns 
     col1, col2, col3 = st.columns([1, 2, 1])
 
+    with col3:
+        # Create a dropdown for selecting departments
+        department = st.selectbox("Select Department", ["All"] + storage.DEPARTMENTS)
+
+    # Load the precomputed monthly x category x department totals
+    df = storage.read_expenditure_rollup(None if department == "All" else department)
+    if df.empty:
+        st.error("No accounts payable data found.")
+        return
+
     with col1:
         # Summary view of total company expenditure
         total_expenditure = df["Total"].sum()
         st.metric("Total Company Expenditure", f"${total_expenditure:,.2f}")
-    
-    with col3:
-        # Create a dropdown for selecting departments from the list: ['HR', 'IT', 'Finance', 'Operations']
-        department = st.selectbox("Select Department", ['HR', 'IT', 'Finance', 'Operations'])
 
+    # Lines without a usable due date count towards the total only
+    df = df[df["Month"] != ""]
 
     # Bar graph: Expenditure per month with category colors
     st.write("### Monthly Expenditure by Category")
-    monthly_expenditure = df.groupby(["Month", "Category"])['Total'].sum().unstack().fillna(0)
-    monthly_expenditure.plot(kind='bar', stacked=True, figsize=(10, 5))
-    plt.xlabel("Month")
-    plt.ylabel("Expenditure")
-    plt.title("Monthly Expenditure by Category")
-    st.pyplot(plt.gcf())
-
-    
+    monthly_expenditure = df.pivot_table(
+        index="Month", columns="Category", values="Total", aggfunc="sum", observed=True
+    ).fillna(0)
+    st.image(render_chart(
+        "stacked_bar", monthly_expenditure,
+        xlabel="Month", ylabel="Expenditure", title="Monthly Expenditure by Category"
+    ), use_container_width=True)
 
     # Line graph: Historical expenditure
     st.write("### Historical Expenditure Trend")
-    historical_expenditure = df.groupby("Month")["Total"].sum()
-    historical_expenditure.plot(kind='line', marker='o', figsize=(10, 5))
-    plt.xlabel("Month")
-    plt.ylabel("Total Expenditure")
-    plt.title("Historical Expenditure Trend")
-    st.pyplot(plt.gcf())
\ No newline at end of file
+    historical_expenditure = df.groupby("Month", observed=True)["Total"].sum()
+    st.image(render_chart(
+        "line", historical_expenditure,
+        xlabel="Month", ylabel="Total Expenditure", title="Historical Expenditure Trend"
+    ), use_container_width=True)
@@ -0,0 +1,34 @@
+import streamlit as st
+from utils import tracing
+
+WINDOWS = [1000, 10000, 50000]
+
+
+def performance():
+    st.title("Performance")
+
+    window = st.selectbox("Recent spans", WINDOWS, index=1)
+    traces = tracing.read_traces(limit=window)
+    if traces.empty:
+        st.info(f"No traces recorded yet. Spans are written to {tracing.TRACE_LOG} as documents are processed.")
+        return
+
+    st.caption(f"{len(traces)} spans from {tracing.TRACE_LOG}")
+
+    # Latency per stage
+    st.write("### Stages")
+    st.dataframe(
+        tracing.stage_summary(traces),
+        column_config={
+            "Cache Hit Rate": st.column_config.ProgressColumn("Cache Hit Rate", min_value=0, max_value=1, format="%.2f"),
+        },
+        use_container_width=True
+    )
+
+    # Slowest documents with their stage breakdown
+    st.write("### Slowest Recent Documents")
+    slowest = tracing.slowest_documents(traces)
+    if slowest.empty:
+        st.info("No documents processed in this window.")
+    else:
+        st.dataframe(slowest, hide_index=True, use_container_width=True)
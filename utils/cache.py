@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import tempfile
+
+CACHE_DIR = os.getenv("STREAMLINE_CACHE_DIR", ".cache")
+CACHE_MAX_BYTES = int(os.getenv("STREAMLINE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def hash_bytes(data):
+    """Content hash of raw bytes (e.g. an uploaded image)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_key(*parts):
+    """Build a cache key from several string parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    Content-addressed JSON cache stored on disk.
+
+    Entries are individual files named by their key. Reads bump the file's
+    modification time so eviction can drop the least recently used entries
+    once the directory grows past ``max_bytes``.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def get(self, key):
+        """Return the cached value for ``key`` or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return value
+
+    def set(self, key, value):
+        """Store ``value`` (JSON-serialisable) under ``key``."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temp file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+        self._size += os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in ``max_bytes``."""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._size = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    def clear(self):
+        """Remove every entry."""
+        for path, _, _ in list(self._entries()):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._size = 0
+
+
+_cache = None
+
+
+def get_cache():
+    """Process-wide cache instance."""
+    global _cache
+    if _cache is None:
+        _cache = DiskCache()
+    return _cache
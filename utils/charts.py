@@ -0,0 +1,108 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from matplotlib.figure import Figure
+
+# Rendered charts are kept up to this many bytes in total (least recently used dropped first)
+CHART_CACHE_BYTES = int(os.getenv("STREAMLINE_CHART_CACHE_BYTES", str(16 * 1024 * 1024)))
+
+_cache = OrderedDict()
+_cache_size = 0
+_cache_lock = threading.Lock()
+
+
+def chart_key(kind, data, fmt, options):
+    """Hash of the chart kind, options and the aggregate data being plotted."""
+    digest = hashlib.sha256()
+    digest.update(f"{kind}|{fmt}|{sorted(options.items())}".encode("utf-8"))
+    if isinstance(data, pd.DataFrame):
+        digest.update(str(list(data.columns)).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _draw(kind, data, ax, options):
+    if kind == "stacked_bar":
+        data.plot(kind="bar", stacked=True, ax=ax)
+    elif kind == "line":
+        data.plot(kind="line", marker="o", ax=ax)
+    elif kind == "pie":
+        ax.pie(
+            data.to_numpy(),
+            labels=list(data.index),
+            autopct="%1.1f%%",
+            colors=options.get("colors"),
+            startangle=90
+        )
+        ax.axis("equal")  # Equal aspect ratio ensures the pie chart is circular.
+    else:
+        raise ValueError(f"Unknown chart kind: {kind}")
+
+    if options.get("xlabel"):
+        ax.set_xlabel(options["xlabel"])
+    if options.get("ylabel"):
+        ax.set_ylabel(options["ylabel"])
+    if options.get("title"):
+        ax.set_title(options["title"])
+
+
+def _render(kind, data, fmt, figsize, options):
+    # A standalone Figure is never registered with pyplot, so nothing leaks
+    # into the global figure manager; it is cleared explicitly once saved.
+    fig = Figure(figsize=figsize)
+    try:
+        ax = fig.subplots()
+        _draw(kind, data, ax, options)
+        fig.tight_layout()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=fmt)
+        return buffer.getvalue()
+    finally:
+        fig.clear()
+
+
+def render_chart(kind, data, fmt="png", figsize=(10, 5), **options):
+    """
+    Render a chart to PNG/SVG bytes, reusing the cached bytes for identical data.
+
+    Args:
+        kind (str): "stacked_bar", "line" or "pie"
+        data (pd.DataFrame or pd.Series): Aggregated data to plot
+        fmt (str): "png" or "svg"
+        figsize (tuple): Figure size in inches
+        options: Labels (xlabel, ylabel, title) and pie colors
+    """
+    global _cache_size
+    key = chart_key(kind, data, fmt, {"figsize": figsize, **options})
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    image = _render(kind, data, fmt, figsize, options)
+
+    with _cache_lock:
+        if key not in _cache:
+            _cache[key] = image
+            _cache_size += len(image)
+            while _cache_size > CHART_CACHE_BYTES and len(_cache) > 1:
+                _, evicted = _cache.popitem(last=False)
+                _cache_size -= len(evicted)
+    return image
+
+
+def cache_info():
+    """Number of cached charts and their total size in bytes."""
+    with _cache_lock:
+        return len(_cache), _cache_size
+
+
+def clear_chart_cache():
+    global _cache_size
+    with _cache_lock:
+        _cache.clear()
+        _cache_size = 0
@@ -0,0 +1,135 @@
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Tried in order; the first matching format wins for ambiguous dates
+DATE_FORMATS = [
+    "%Y-%m-%d",    # 2024-07-19
+    "%d.%m.%Y",    # 19.07.2024
+    "%m/%d/%y",    # 7/19/24
+    "%d/%m/%y",    # 19/07/24
+    "%Y/%m/%d",    # 2024/07/19
+    "%m-%d-%y",    # 7-19-24
+    "%d-%m-%y",    # 19-07-24
+    "%m/%d/%Y",    # 7/19/2024
+    "%d/%m/%Y",    # 19/07/2024
+    "%d-%m-%Y",    # 19-07-2024
+    "%d.%m.%y",    # 19.07.24
+    "%B %d, %Y",   # July 19, 2024
+    "%b %d, %Y",   # Jul 19, 2024
+    "%d %B %Y",    # 19 July 2024
+    "%d %b %Y",    # 19 Jul 2024
+    "%y-%m-%d",    # 24-07-19
+    "%y/%m/%d",    # 24/07/19
+]
+
+# Company goal due dates are day-first, so 01/02/2025 is 1 February
+GOAL_DATE_FORMATS = (
+    "%d-%m-%Y", "%d/%m/%Y", "%Y-%m-%d", "%Y/%m/%d",
+    "%d-%m-%y", "%d/%m/%y", "%y-%m-%d", "%y/%m/%d",
+)
+
+ISO_FORMAT = "%Y-%m-%d"
+
+
+@lru_cache(maxsize=10000)
+def parse_date(date_str, formats=None):
+    """
+    Parse a single date string, returning a datetime or None.
+
+    ``formats`` (a tuple, tried in order) replaces DATE_FORMATS and the
+    month-first short-date fallback.
+    """
+    if date_str is None or (isinstance(date_str, float) and pd.isna(date_str)):
+        return None
+    clean_date = str(date_str).strip()
+
+    for fmt in formats or DATE_FORMATS:
+        try:
+            return datetime.strptime(clean_date, fmt)
+        except ValueError:
+            continue
+    if formats:
+        return None
+
+    # Handle short dates with a missing century, e.g. 7/19/24
+    try:
+        if len(clean_date) <= 8:
+            parts = clean_date.replace('-', '/').split('/')
+            if len(parts) == 3:
+                month, day, year = parts
+                if len(year) == 2:
+                    year = '20' + year
+                return datetime.strptime(f"{month}/{day}/{year}", "%m/%d/%Y")
+    except ValueError:
+        pass
+
+    return None
+
+
+def to_iso(date_str):
+    """Normalize a date string to YYYY-MM-DD, or None if it cannot be parsed."""
+    parsed = parse_date(date_str)
+    return parsed.strftime(ISO_FORMAT) if parsed else None
+
+
+_parsed_values = {}
+MAX_MEMOIZED_VALUES = 100000
+
+
+def _parse_unique(values):
+    """Factorize ``values`` and parse each distinct value once."""
+    series = pd.Series(values, copy=False)
+    codes, uniques = pd.factorize(series.astype("string").str.strip())
+
+    parsed = pd.Series(pd.NaT, index=range(len(uniques)), dtype="datetime64[ns]")
+    pending = []
+    for position, value in enumerate(uniques):
+        if value in _parsed_values:
+            parsed.iat[position] = _parsed_values[value]
+        else:
+            pending.append(position)
+
+    remaining = pd.Series(uniques[pending], index=pending, dtype="object")
+    for fmt in DATE_FORMATS:
+        if remaining.empty:
+            break
+        matched = pd.to_datetime(remaining, format=fmt, errors="coerce")
+        hits = matched.notna()
+        parsed.loc[matched.index[hits]] = matched[hits]
+        remaining = remaining[~hits]
+
+    # Whatever the strict formats missed goes through the single-value fallback
+    for position, value in remaining.items():
+        parsed.iat[position] = parse_date(value) or pd.NaT
+
+    if len(_parsed_values) + len(pending) > MAX_MEMOIZED_VALUES:
+        _parsed_values.clear()
+    for position in pending:
+        _parsed_values[uniques[position]] = parsed.iat[position]
+
+    return series.index, codes, parsed
+
+
+def parse_dates(values):
+    """
+    Parse a column of date strings in any supported format.
+
+    Each distinct value is parsed once: formats are tried column-wide over
+    the still-unparsed values, and results are memoized across calls.
+    Returns a datetime64 Series aligned with ``values`` (NaT when unparseable).
+    """
+    index, codes, parsed = _parse_unique(values)
+    # Missing values have code -1, which picks the trailing NaT
+    result = np.append(parsed.to_numpy(), np.datetime64("NaT"))[codes]
+    return pd.Series(result, index=index, dtype="datetime64[ns]")
+
+
+def normalize_dates(values):
+    """Normalize a column of date strings to YYYY-MM-DD (None when unparseable)."""
+    index, codes, parsed = _parse_unique(values)
+    iso = parsed.dt.strftime(ISO_FORMAT).astype(object).where(parsed.notna(), None)
+    result = np.append(iso.to_numpy(dtype=object), None)[codes]
+    return pd.Series(result, index=index, dtype="object")
@@ -0,0 +1,141 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from utils import storage
+from utils.cache import hash_bytes
+
+HASH_SIZE = 16
+BANDS = 16
+BAND_BITS = HASH_SIZE * HASH_SIZE // BANDS
+
+# Perceptual hashes within this many differing bits (of 256) count as the same
+# document. Lookups split the hash into BANDS exact-match bands, which finds
+# every hash within BANDS - 1 bits, so larger values would miss some matches.
+NEAR_DUPLICATE_DISTANCE = min(int(os.getenv("STREAMLINE_NEAR_DUPLICATE_DISTANCE", "12")), BANDS - 1)
+
+# Pixels darker than this count as content when trimming page margins
+INK_THRESHOLD = 192
+
+_dhashes = OrderedDict()
+_dhashes_lock = threading.Lock()
+MAX_MEMOIZED_HASHES = 1024
+
+
+def dhash(image, hash_size=HASH_SIZE):
+    """
+    Difference hash: one bit per pair of horizontally adjacent pixels of a
+    shrunken grayscale image.
+
+    The page is first trimmed to its printed content, so rescans with
+    different margins or resolution hash alike.
+    """
+    gray = image.convert("L")
+    content = ImageOps.invert(gray).point(lambda p: 255 if p > 255 - INK_THRESHOLD else 0).getbbox()
+    if content:
+        gray = gray.crop(content)
+    small = gray.resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def bands(value):
+    """Split a perceptual hash into BANDS integers of BAND_BITS bits."""
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (BAND_BITS * i)) & mask for i in range(BANDS)]
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def fingerprint(data, name=None):
+    """
+    Content and perceptual hash of an uploaded document.
+
+    ``dhash`` is None for files that are not images. Hashes are memoized by
+    content hash, so Streamlit reruns don't decode the same upload again.
+    """
+    sha256 = hash_bytes(data)
+    with _dhashes_lock:
+        if sha256 in _dhashes:
+            _dhashes.move_to_end(sha256)
+            return {"sha256": sha256, "dhash": _dhashes[sha256], "name": name}
+
+    try:
+        value = dhash(Image.open(io.BytesIO(data)))
+    except Exception:
+        value = None
+
+    with _dhashes_lock:
+        _dhashes[sha256] = value
+        if len(_dhashes) > MAX_MEMOIZED_HASHES:
+            _dhashes.popitem(last=False)
+    return {"sha256": sha256, "dhash": value, "name": name}
+
+
+def find_duplicate_document(document):
+    """
+    Look up a fingerprinted document among those already processed.
+
+    Returns None, or a dict describing the earlier document with ``kind``
+    "exact" (same bytes) or "near" (perceptual hash within
+    NEAR_DUPLICATE_DISTANCE bits) and the ``distance`` in bits.
+    """
+    value = document["dhash"]
+    candidates = storage.find_document(document["sha256"], bands(value) if value is not None else None)
+    best = None
+    for candidate in candidates:
+        if candidate["sha256"] == document["sha256"]:
+            return {**candidate, "kind": "exact", "distance": 0}
+        distance = hamming(value, int(candidate["dhash"], 16))
+        if distance <= NEAR_DUPLICATE_DISTANCE and (best is None or distance < best["distance"]):
+            best = {**candidate, "kind": "near", "distance": distance}
+    return best
+
+
+def find_duplicate_invoice(data):
+    """The earlier invoice with the same number, date and total as extracted ``data``, or None."""
+    key = invoice_key_of(data)
+    return storage.find_invoice(key) if key else None
+
+
+def header_recorded(invoice_info):
+    """Whether an invoice with this header's number and date is already recorded, whatever its total."""
+    prefix = storage.invoice_key((invoice_info or {}).get("number"), (invoice_info or {}).get("date"), None)
+    return prefix is not None and storage.invoice_header_recorded(prefix)
+
+
+def invoice_key_of(data):
+    """Exact duplicate key of an extraction result."""
+    return storage.invoice_key(
+        data.get("invoice_info", {}).get("number"),
+        data.get("invoice_info", {}).get("date"),
+        data.get("summary", {}).get("total"),
+    )
+
+
+def record_document(document, invoice_key=None):
+    """Remember a processed document so a resubmission is flagged before OCR."""
+    value = document["dhash"]
+    storage.record_document(
+        document["sha256"],
+        f"{value:0{HASH_SIZE * HASH_SIZE // 4}x}" if value is not None else None,
+        bands(value) if value is not None else None,
+        document.get("name"),
+        invoice_key,
+    )
+
+
+def describe(match):
+    """Human-readable summary of a duplicate match."""
+    if "kind" in match:
+        what = "identical to" if match["kind"] == "exact" else f"nearly identical ({match['distance']} bits) to"
+        invoice = f", invoice {match['invoice_key'].split('|')[0]}" if match.get("invoice_key") else ""
+        return f"{what} {match.get('name') or 'a document'} processed {match['created_at']}{invoice}"
+    return f"invoice {match['invoice_number']} ({match['due_date']}, total {match['total']}) already recorded {match['created_at']}"
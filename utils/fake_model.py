@@ -0,0 +1,53 @@
+import time
+
+
+class FakeResponse:
+    """Minimal stand-in for a Gemini response object."""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeStreamResponse:
+    """
+    Minimal stand-in for a streamed Gemini response: iterating it yields
+    chunks of ``chunk_size`` characters, spreading ``latency`` across them.
+    """
+
+    def __init__(self, text, latency=0.0, chunk_size=64):
+        self.text = text
+        self.latency = latency
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        chunks = [self.text[i:i + self.chunk_size] for i in range(0, len(self.text), self.chunk_size)]
+        for chunk in chunks:
+            if self.latency:
+                time.sleep(self.latency / len(chunks))
+            yield FakeResponse(chunk)
+
+
+class FakeModel:
+    """
+    Offline stand-in for ``genai.GenerativeModel``.
+
+    ``responder`` is called with the prompt and returns the response text, so
+    tests and benchmarks can script the model without network access.
+    Every prompt is recorded in ``calls``. With ``stream=True`` the text
+    arrives in ``chunk_size`` pieces over ``latency`` seconds.
+    """
+
+    def __init__(self, responder=None, latency=0.0, model_name="fake-model", chunk_size=64):
+        self.responder = responder or (lambda prompt: "")
+        self.latency = latency
+        self.model_name = model_name
+        self.chunk_size = chunk_size
+        self.calls = []
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.calls.append(prompt)
+        if stream:
+            return FakeStreamResponse(self.responder(prompt), self.latency, self.chunk_size)
+        if self.latency:
+            time.sleep(self.latency)
+        return FakeResponse(self.responder(prompt))
@@ -0,0 +1,118 @@
+from collections import Counter, OrderedDict
+
+NGRAM_SIZE = 3
+
+
+def normalize_goal(goal):
+    """Normalize goal or item text for matching."""
+    return str(goal).lower().strip()
+
+
+def ngrams(text, size=NGRAM_SIZE):
+    """Set of character n-grams in a string."""
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class GoalIndex:
+    """
+    Precomputed lookup structure for matching items against company goals.
+
+    Every goal is stored in normalized form together with its precomputed
+    variations ("keys"). A character n-gram inverted index maps each n-gram
+    to the keys containing it, so an item only has to be compared with keys
+    that could be a substring of it (or contain it) instead of every goal.
+    """
+
+    def __init__(self, goals, goal_variations=None):
+        goal_variations = goal_variations or {}
+
+        self.goals = list(dict.fromkeys(normalize_goal(goal) for goal in goals))
+        self.keys = []        # normalized key text
+        self.key_goals = []   # index into self.goals for each key
+        self.key_sizes = []   # number of distinct n-grams in each key
+        self.postings = {}    # n-gram -> list of key ids
+        self.short_keys = []  # keys too short to have an n-gram
+
+        for goal_id, goal in enumerate(self.goals):
+            variations = goal_variations.get(goal, [])
+            for key in dict.fromkeys([goal, *(normalize_goal(v) for v in variations)]):
+                if key:
+                    self._add_key(key, goal_id)
+
+    def _add_key(self, key, goal_id):
+        key_id = len(self.keys)
+        grams = ngrams(key)
+        self.keys.append(key)
+        self.key_goals.append(goal_id)
+        self.key_sizes.append(len(grams))
+        if not grams:
+            self.short_keys.append(key_id)
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(key_id)
+
+    def __len__(self):
+        return len(self.goals)
+
+    def candidates(self, text):
+        """Ids of keys that may be a substring of ``text`` or contain it."""
+        grams = ngrams(text)
+        if not grams:
+            # Text shorter than an n-gram can be inside any key
+            return range(len(self.keys))
+
+        counts = Counter()
+        for gram in grams:
+            counts.update(self.postings.get(gram, ()))
+
+        # A substring shares all of its n-grams with the containing string
+        found = [
+            key_id for key_id, shared in counts.items()
+            if shared == self.key_sizes[key_id] or shared == len(grams)
+        ]
+        return found + self.short_keys
+
+    def find_matches(self, item_description, variations=()):
+        """
+        Yield (text, key, goal) for every goal key that is a substring of the
+        item or one of its variations, or contains it.
+        """
+        texts = [normalize_goal(item_description)]
+        texts += [normalize_goal(variation) for variation in variations]
+
+        for text in dict.fromkeys(texts):
+            if not text:
+                continue
+            for key_id in self.candidates(text):
+                key = self.keys[key_id]
+                if key in text or text in key:
+                    yield text, key, self.goals[self.key_goals[key_id]]
+
+
+_indexes = OrderedDict()
+
+
+def get_goal_index(goals, load_variations=None, version=None, maxsize=8):
+    """
+    Return a GoalIndex for a goal list, reusing a previously built one.
+
+    Indexes are cached per (goals, version) so loading the same goals again
+    costs a dictionary lookup. ``load_variations`` is only called when the
+    index has to be built and should return a dict of goal -> variations.
+    """
+    normalized = tuple(normalize_goal(goal) for goal in goals)
+    key = (normalized, version)
+    index = _indexes.get(key)
+    if index is None:
+        goal_variations = load_variations(list(normalized)) if load_variations else None
+        index = GoalIndex(normalized, goal_variations)
+        _indexes[key] = index
+        if len(_indexes) > maxsize:
+            _indexes.popitem(last=False)
+    else:
+        _indexes.move_to_end(key)
+    return index
+
+
+def clear_goal_indexes():
+    """Forget all cached indexes (e.g. after goals change)."""
+    _indexes.clear()
@@ -0,0 +1,205 @@
+"""
+Headless invoice ingestion.
+
+Runs the upload pipeline (duplicate check, OCR, extraction, goal
+verification, save) over every invoice in an inbox directory, across
+several worker processes. Progress is checkpointed per file in the
+ingest_jobs table, so an interrupted run resumes where it stopped.
+
+    python -m utils.ingest inbox/                 # process the backlog and exit
+    python -m utils.ingest inbox/ --watch         # keep watching for new files
+    python -m utils.ingest inbox/ --workers 8 --department Finance
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from utils import storage
+
+QUEUED = "Queued"
+RUNNING = "Running"
+DONE = "Done"
+DUPLICATE = "Duplicate"
+FAILED = "Failed"
+
+SUPPORTED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".pdf", ".tif", ".tiff"}
+INGEST_WORKERS = int(os.getenv("STREAMLINE_INGEST_WORKERS", str(os.cpu_count() or 1)))
+MAX_ATTEMPTS = 3
+WORKER_CRASHED = "Worker process crashed (out of memory or a native crash)"
+
+# Files modified more recently than this may still be being written
+SETTLE_SECONDS = 2.0
+
+
+def scan(inbox, settle_seconds=SETTLE_SECONDS):
+    """(path, size, mtime) of every supported file under ``inbox`` that has finished writing."""
+    now = time.time()
+    for root, _, names in os.walk(inbox):
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() not in SUPPORTED_EXTENSIONS:
+                continue
+            path = os.path.abspath(os.path.join(root, name))
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime >= settle_seconds:
+                yield path, stat.st_size, stat.st_mtime
+
+
+def ingest_file(path, department=None, allow_duplicates=False):
+    """
+    Process one file in a worker process.
+
+    Returns (state, invoice_ids, note) where state is DONE or DUPLICATE.
+    """
+    from utils.pipeline import process_document
+
+    with open(path, "rb") as f:
+        data = f.read()
+    result = process_document(data, os.path.basename(path), department=department, allow_duplicates=allow_duplicates)
+
+    if result["duplicate"] is not None and not result["ids"]:
+        from utils.duplicates import describe
+        return DUPLICATE, [], describe(result["duplicate"])
+    problems = [message for level, message in result["messages"] if level == "error"]
+    return DONE, result["ids"], "; ".join(problems) or None
+
+
+def _run_pool(paths, workers, department, allow_duplicates, report):
+    """
+    Process the jobs in ``paths`` (a deque, consumed from the left) on a new
+    pool of ``workers`` processes, calling ``report(path, state, ids, note)``
+    as each finishes.
+
+    A worker that dies (out of memory, a native crash) breaks the whole
+    pool. Returns the jobs that were in flight when that happened; jobs
+    not yet submitted stay in ``paths``.
+    """
+    in_flight = {}
+    suspects = []
+    broken = False
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        def submit_next():
+            nonlocal broken
+            if broken or not paths:
+                return
+            path = paths.popleft()
+            storage.update_ingest_job(path, RUNNING, attempt=True)
+            try:
+                in_flight[pool.submit(ingest_file, path, department, allow_duplicates)] = path
+            except BrokenProcessPool:
+                broken = True
+                storage.release_ingest_jobs([path])
+                paths.appendleft(path)
+
+        # Keep a couple of jobs per worker queued so no process sits idle
+        for _ in range(workers * 2):
+            submit_next()
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = in_flight.pop(future)
+                try:
+                    state, ids, note = future.result()
+                except BrokenProcessPool:
+                    broken = True
+                    suspects.append(path)
+                    continue
+                except Exception as e:
+                    report(path, FAILED, None, f"{type(e).__name__}: {e}")
+                else:
+                    report(path, state, ids, note)
+                submit_next()
+    return suspects
+
+
+def run_queued(workers=INGEST_WORKERS, department=None, allow_duplicates=False, log=print):
+    """Process every queued job across ``workers`` processes. Returns the number of jobs finished."""
+    jobs = storage.read_ingest_jobs([QUEUED])
+    if jobs.empty:
+        return 0
+
+    finished = 0
+
+    def report(path, state, ids=None, note=None):
+        nonlocal finished
+        storage.update_ingest_job(path, state, error=note, invoice_ids=ids)
+        finished += 1
+        detail = f"{len(ids)} line(s)" if state == DONE else note
+        log(f"[{finished}/{len(jobs)}] {path}: {state.lower()} ({detail})")
+
+    paths = deque(jobs["path"].tolist())
+    while paths:
+        suspects = _run_pool(paths, max(1, workers), department, allow_duplicates, report)
+        if len(suspects) == 1:
+            report(suspects[0], FAILED, note=WORKER_CRASHED)
+        elif suspects:
+            # Any of them may have killed the worker: rerun each alone to find out
+            log(f"A worker crashed; retrying {len(suspects)} in-flight file(s) one at a time")
+            storage.release_ingest_jobs(suspects)
+            for path in suspects:
+                if _run_pool(deque([path]), 1, department, allow_duplicates, report):
+                    report(path, FAILED, note=WORKER_CRASHED)
+    return finished
+
+
+def ingest(inbox, watch=False, interval=5.0, workers=INGEST_WORKERS, department=None,
+           allow_duplicates=False, max_attempts=MAX_ATTEMPTS, log=print):
+    """Queue the inbox's files and process them, once or (with ``watch``) until interrupted."""
+    # Jobs left Running were interrupted by a crash or restart. One that keeps
+    # taking the daemon down with it gives up after max_attempts
+    recovered = storage.requeue_ingest_jobs([RUNNING], max_attempts=max_attempts)
+    if recovered:
+        log(f"Resuming {recovered} interrupted job(s)")
+    abandoned = storage.fail_ingest_jobs([RUNNING], f"Interrupted {max_attempts} times; giving up")
+    if abandoned:
+        log(f"Giving up on {abandoned} job(s) interrupted {max_attempts} times")
+
+    while True:
+        queued = storage.queue_ingest_jobs(scan(inbox))
+        retried = storage.requeue_ingest_jobs([FAILED], max_attempts=max_attempts)
+        if queued or retried:
+            log(f"Queued {queued} new and {retried} failed file(s)")
+        run_queued(workers, department, allow_duplicates, log)
+        if not watch:
+            return storage.ingest_summary()
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inbox", help="Directory of invoice images, PDFs or TIFFs")
+    parser.add_argument("--watch", action="store_true", help="Keep watching the inbox for new files")
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between inbox scans when watching")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--department", choices=storage.DEPARTMENTS)
+    parser.add_argument("--allow-duplicates", action="store_true", help="Process documents flagged as duplicates")
+    parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS, help="Attempts per file before giving up")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.inbox):
+        parser.error(f"{args.inbox} is not a directory")
+
+    def log(message):
+        print(message, flush=True)
+
+    try:
+        summary = ingest(
+            args.inbox, args.watch, args.interval, args.workers, args.department,
+            args.allow_duplicates, args.max_attempts, log
+        )
+    except KeyboardInterrupt:
+        # Jobs still marked Running are picked up again on the next start
+        log("Interrupted; unfinished files will be resumed on the next run")
+        sys.exit(130)
+    log("Jobs: " + ", ".join(f"{state} {count}" for state, count in sorted(summary.items())))
+
+
+if __name__ == "__main__":
+    main()
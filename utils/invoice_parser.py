@@ -0,0 +1,225 @@
+import re
+from collections import Counter
+
+# Minimum confidence for the local parser's result to be used without the model
+CONFIDENCE_THRESHOLD = 0.85
+
+# Header lines made only of these words title the document rather than name the vendor
+GENERIC_HEADER_WORDS = {
+    "invoice", "tax", "vat", "gst", "bill", "receipt", "sales", "commercial", "proforma", "pro", "forma",
+    "original", "duplicate", "copy", "for", "recipient", "statement", "page", "of",
+}
+
+NUMBER = r"[$€£₹]?\s*-?\d[\d,]*(?:\.\d+)?"
+DATE = (
+    r"\d{1,4}[./-]\d{1,2}[./-]\d{2,4}"
+    r"|\d{1,2}\s+[A-Za-z]{3,9}\.?,?\s+\d{4}"
+    r"|[A-Za-z]{3,9}\.?\s+\d{1,2},?\s+\d{4}"
+)
+
+INVOICE_ID = r"[A-Z0-9][A-Z0-9\-/]*"
+
+# Labels and values must sit on the same line, hence [ \t] rather than \s
+INVOICE_NUMBER_RE = re.compile(
+    r"invoice[ \t]*(?:no\.?|number|num\.?|#|id)[ \t]*[:#.]?[ \t]*(" + INVOICE_ID + ")", re.IGNORECASE
+)
+DATE_RE = re.compile(r"(?:invoice[ \t]*)?date[ \t]*(?:of[ \t]+issue)?[ \t]*[:.]?[ \t]*(" + DATE + r")", re.IGNORECASE)
+ANY_DATE_RE = re.compile(r"\b(" + DATE + r")\b")
+SUBTOTAL_RE = re.compile(r"sub[ \t]*-?[ \t]*total[ \t]*[:.]?[ \t]*(" + NUMBER + ")", re.IGNORECASE)
+TAX_RE = re.compile(r"\b(?:tax|vat|gst)\b[^\n]*?(" + NUMBER + r")[ \t]*$", re.IGNORECASE | re.MULTILINE)
+TOTAL_RE = re.compile(
+    r"(?<![a-z])(?<!sub )(?<!sub-)total[ \t]*(?:amount|due|payable)?[ \t]*[:.]?[ \t]*(" + NUMBER + ")",
+    re.IGNORECASE
+)
+TRAILING_NUMBERS_RE = re.compile(r"^(?P<description>.*?[A-Za-z].*?)\s+(?P<numbers>(?:" + NUMBER + r"\s*)+)$")
+VENDOR_RE = re.compile(
+    r"^[ \t]*(?:vendor|seller|supplier|sold[ \t]+by|billed[ \t]+by|from)[ \t]*:[ \t]*(.*\S)", re.IGNORECASE | re.MULTILINE
+)
+# The customer's block: a vendor named after it would be the customer's name
+RECIPIENT_RE = re.compile(r"\b(?:bill(?:ed)?|ship(?:ped)?|sold|invoice)[ \t]+to\b", re.IGNORECASE)
+SUMMARY_LINE_RE = re.compile(r"\b(sub\s*-?\s*total|total|tax|vat|gst|balance|amount due|discount|shipping)\b", re.IGNORECASE)
+
+# Default position of each field among the trailing numbers of an item line
+DEFAULT_ITEM_COLUMNS = {"quantity": -3, "price": -2, "total": -1}
+
+
+def to_number(value):
+    """Parse an OCR'd amount such as "$1,234.50"."""
+    try:
+        return float(re.sub(r"[^\d.\-]", "", str(value)))
+    except ValueError:
+        return None
+
+
+def _words(line):
+    return re.findall(r"[a-z]{2,}", line.lower())
+
+
+def vendor_key(text):
+    """
+    Identify the vendor of an invoice by name.
+
+    A labelled line ("Vendor: ...", "Sold by: ...") wins; otherwise the
+    first header line that isn't a generic title such as "TAX INVOICE".
+    Returns "" when the header reaches the invoice's fields without naming
+    a vendor, so no template is shared between unrelated vendors.
+    """
+    match = VENDOR_RE.search(text)
+    if match and _words(match.group(1)):
+        return " ".join(_words(match.group(1)))
+    for line in text.splitlines():
+        words = _words(line)
+        if not words or set(words) <= GENERIC_HEADER_WORDS:
+            continue
+        fields = (INVOICE_NUMBER_RE, DATE_RE, RECIPIENT_RE)
+        if any(pattern.search(line) for pattern in fields) or TRAILING_NUMBERS_RE.match(line.strip()):
+            return ""
+        return " ".join(words)
+    return ""
+
+
+def _close(a, b, tolerance=0.01):
+    return a is not None and b is not None and abs(a - b) <= max(tolerance * abs(b), 0.01)
+
+
+def _find_labelled(pattern, text, label=None, value=r"\S+"):
+    """Find a value by a learned label first, then by the generic pattern."""
+    if label:
+        match = re.search(re.escape(label) + r"[ \t]*[:#.]?[ \t]*(" + value + ")", text, re.IGNORECASE)
+        if match:
+            return match.group(1).strip(".,;")
+    match = pattern.search(text)
+    return match.group(1).strip() if match else None
+
+
+def parse_items(text, template=None):
+    """Parse line items from lines ending in quantity/price/total columns."""
+    columns = (template or {}).get("item_columns", DEFAULT_ITEM_COLUMNS)
+    needed = max(-position for position in columns.values())
+    categories = (template or {}).get("categories", {})
+    default_category = (template or {}).get("default_category")
+
+    items = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or SUMMARY_LINE_RE.search(line):
+            continue
+        match = TRAILING_NUMBERS_RE.match(line)
+        if not match:
+            continue
+        numbers = [to_number(n) for n in re.findall(NUMBER, match.group("numbers"))]
+        if len(numbers) < needed:
+            continue
+
+        description = match.group("description").strip(" .:-|")
+        values = {field: numbers[position] for field, position in columns.items()}
+        items.append({
+            "description": description,
+            "quantity": values.get("quantity", 1),
+            "price": values.get("price"),
+            "total": values.get("total"),
+            "category": categories.get(description.lower(), default_category),
+        })
+    return items
+
+
+def parse_invoice(text, template=None):
+    """
+    Extract invoice data with regex rules and an optional vendor template.
+
+    Returns (data, confidence) where ``data`` follows the same schema as the
+    Gemini extraction and ``confidence`` is the share of consistency checks
+    that passed (0.0 - 1.0). It is 0.0 unless the invoice number, date,
+    total and a category for every item were all found: without them the
+    invoice can't be checked for duplicates or screened against the goals.
+    """
+    template = template or {}
+    number = _find_labelled(INVOICE_NUMBER_RE, text, template.get("number_label"), INVOICE_ID)
+    date = _find_labelled(DATE_RE, text, template.get("date_label"), DATE)
+    if date is None:
+        match = ANY_DATE_RE.search(text)
+        date = match.group(1) if match else None
+
+    items = parse_items(text, template)
+    subtotal = to_number(_find_labelled(SUBTOTAL_RE, text))
+    tax = to_number(_find_labelled(TAX_RE, text)) or 0
+    total = to_number(_find_labelled(TOTAL_RE, text))
+    items_total = sum(item["total"] or 0 for item in items)
+    if subtotal is None and items:
+        subtotal = items_total
+
+    required = [
+        number is not None,
+        date is not None,
+        total is not None,
+        bool(items) and all(item["category"] for item in items),
+    ]
+    checks = [
+        _close(items_total, subtotal) or _close(items_total, total),
+        all(_close(item["quantity"] * (item["price"] or 0), item["total"]) for item in items),
+    ]
+
+    data = {
+        "invoice_info": {"number": number, "date": date},
+        "items": items,
+        "summary": {"subtotal": subtotal, "tax": tax, "total": total},
+    }
+    return data, (sum(checks) / len(checks) if all(required) else 0.0)
+
+
+def _label_before(text, value):
+    """Text preceding ``value`` on the line where it appears."""
+    if not value:
+        return None
+    for line in text.splitlines():
+        position = line.find(str(value))
+        if position > 0:
+            label = line[:position].strip(" :#.-\t")
+            if re.search(r"[A-Za-z]", label):
+                return label
+    return None
+
+
+def learn_template(text, data):
+    """
+    Learn a vendor template from a successful model extraction.
+
+    The template records the labels used for the invoice number and date,
+    where quantity/price/total sit among an item line's numbers, and the
+    category of each known item.
+    """
+    template = {
+        "number_label": _label_before(text, data.get("invoice_info", {}).get("number")),
+        "date_label": _label_before(text, data.get("invoice_info", {}).get("date")),
+        "categories": {},
+    }
+
+    columns = Counter()
+    for item in data.get("items", []):
+        description = str(item.get("description", "")).strip()
+        if item.get("category"):
+            template["categories"][description.lower()] = item["category"]
+
+        # Find the item line and the position of each known value among its numbers
+        prefix = description[:20]
+        for line in text.splitlines():
+            if prefix and prefix.lower() in line.lower():
+                numbers = [to_number(n) for n in re.findall(NUMBER, line[line.lower().find(prefix.lower()) + len(prefix):])]
+                # Totals are usually rightmost; each column is claimed once
+                positions = {}
+                for field in ("total", "price", "quantity"):
+                    for position in range(-1, -len(numbers) - 1, -1):
+                        if position not in positions.values() and _close(numbers[position], to_number(item.get(field))):
+                            positions[field] = position
+                            break
+                if "total" in positions:
+                    columns[tuple(sorted(positions.items()))] += 1
+                break
+
+    if columns:
+        template["item_columns"] = dict(columns.most_common(1)[0][0])
+
+    categories = [item.get("category") for item in data.get("items", []) if item.get("category")]
+    if categories:
+        template["default_category"] = Counter(categories).most_common(1)[0][0]
+    return template
@@ -0,0 +1,119 @@
+import json
+
+
+class JsonItemStream:
+    """
+    Incremental parser for a streamed JSON model response.
+
+    Text is fed in chunks as it arrives; ``feed`` returns every element of
+    the top-level ``array_key`` array whose closing brace has been received.
+    Other top-level fields appear in ``fields`` as soon as they are
+    complete, and ``result()`` parses the whole object once it has closed.
+    Anything before the first "{" (such as a ```json fence) is ignored.
+    """
+
+    def __init__(self, array_key="items"):
+        self.array_key = array_key
+        self.text = ""
+        self.fields = {}
+        self._position = 0
+        self._root_start = None
+        self._root_end = None
+        self._stack = []       # open containers, "{" or "["
+        self._keys = []        # key each open container was stored under
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        self._pending_key = None
+        self._field_key = None
+        self._value_start = None
+        self._value_is_scalar = False
+        self._item_start = None
+
+    @property
+    def done(self):
+        return self._root_end is not None
+
+    def _in_items(self):
+        return len(self._stack) == 2 and self._stack[-1] == "[" and self._keys[-1] == self.array_key
+
+    def _end_scalar(self, end):
+        """Finish a top-level scalar value that ends before ``end``."""
+        if self._value_start is not None and self._value_is_scalar:
+            self.fields[self._field_key] = json.loads(self.text[self._value_start:end])
+            self._value_start = None
+
+    def feed(self, chunk):
+        """Consume the next chunk of text and return the items it completed."""
+        self.text += chunk
+        text = self.text
+        items = []
+        i = self._position
+        while i < len(text) and not self.done:
+            c = text[i]
+            if self._root_start is None:
+                if c == "{":
+                    self._root_start = i
+                    self._stack.append("{")
+                    self._keys.append(None)
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._last_string = json.loads(text[self._string_start:i + 1])
+            elif c == '"':
+                self._in_string = True
+                self._string_start = i
+                self._start_value(i, scalar=True)
+                self._pending_key = None
+            elif c == ":":
+                if self._stack[-1] == "{":
+                    self._pending_key = self._last_string
+                    if len(self._stack) == 1:
+                        self._field_key = self._pending_key
+            elif c in "{[":
+                self._start_value(i, scalar=False)
+                if c == "{" and self._in_items():
+                    self._item_start = i
+                self._keys.append(self._pending_key if self._stack[-1] == "{" else None)
+                self._stack.append(c)
+                self._pending_key = None
+            elif c in "}]":
+                if len(self._stack) == 1:
+                    self._end_scalar(i)
+                self._stack.pop()
+                self._keys.pop()
+                if c == "}" and self._item_start is not None and self._in_items():
+                    items.append(json.loads(text[self._item_start:i + 1]))
+                    self._item_start = None
+                if len(self._stack) == 1 and self._value_start is not None and not self._value_is_scalar:
+                    self.fields[self._field_key] = json.loads(text[self._value_start:i + 1])
+                    self._value_start = None
+                if not self._stack:
+                    self._root_end = i
+            elif c == ",":
+                if len(self._stack) == 1:
+                    self._end_scalar(i)
+            elif not c.isspace():
+                self._start_value(i, scalar=True)
+                self._pending_key = None
+            i += 1
+        self._position = i
+        return items
+
+    def _start_value(self, position, scalar):
+        """Note where a top-level field's value starts."""
+        if len(self._stack) == 1 and self._field_key is not None and self._value_start is None \
+                and self._pending_key is not None:
+            self._value_start = position
+            self._value_is_scalar = scalar
+
+    def result(self):
+        """The complete parsed object; raises ValueError if the response was cut short."""
+        if not self.done:
+            raise ValueError("Incomplete JSON response")
+        return json.loads(self.text[self._root_start:self._root_end + 1])
@@ -0,0 +1,231 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+from dotenv import load_dotenv
+
+from utils.tracing import span
+
+MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-1.5-pro")
+
+# Requests per minute allowed by the Gemini quota (0 disables rate limiting).
+# Each process has its own bucket, so divide the quota between processes.
+MODEL_RPM = float(os.getenv("STREAMLINE_MODEL_RPM", "1000"))
+# Seconds of quota that may be spent in one burst
+BURST_SECONDS = 2.0
+MODEL_TIMEOUT = float(os.getenv("STREAMLINE_MODEL_TIMEOUT", "60"))
+MODEL_RETRIES = int(os.getenv("STREAMLINE_MODEL_RETRIES", "4"))
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 20.0
+# Consecutive transient failures that open the circuit, and how long it stays open
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30.0
+
+# HTTP statuses worth retrying: timeouts, rate limiting and server errors
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+
+_model = None
+_model_lock = threading.Lock()
+
+
+class ModelUnavailableError(RuntimeError):
+    """Raised without calling the model while the circuit breaker is open."""
+
+
+def is_transient(error):
+    """Whether a failed model call is worth retrying."""
+    return getattr(error, "code", None) in TRANSIENT_STATUS or isinstance(error, (TimeoutError, ConnectionError))
+
+
+def backoff(attempt):
+    """Seconds to wait before retry ``attempt`` (0-based): exponential with full jitter."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``rate`` tokens per second, holding at most ``capacity``."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, sleeping until one is available. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def drain(self):
+        """Empty the bucket, e.g. after the server reports the quota exhausted."""
+        with self.lock:
+            self.tokens = 0.0
+            self.updated = time.monotonic()
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service for ``cooldown`` seconds after
+    ``threshold`` consecutive failures, then lets one trial call through.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.trial and time.monotonic() - self.opened_at >= self.cooldown:
+                self.trial = True
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self.trial = False
+
+
+class ResilientModel:
+    """
+    Wraps a Gemini model (or anything with ``generate_content``) with the
+    protections every call needs: token-bucket rate limiting at the quota,
+    per-call timeouts, jittered retries of transient errors, a circuit
+    breaker, and single-flight coalescing of identical concurrent prompts,
+    so sessions asking the same thing at once share one request.
+
+    Other attributes, such as ``model_name``, are those of the wrapped model.
+    """
+
+    def __init__(self, model, rpm=MODEL_RPM, timeout=MODEL_TIMEOUT, retries=MODEL_RETRIES, breaker=None):
+        self.model = model
+        self.bucket = TokenBucket(rpm / 60, max(1.0, rpm / 60 * BURST_SECONDS)) if rpm > 0 else None
+        self.timeout = timeout
+        self.retries = retries
+        self.breaker = breaker or CircuitBreaker()
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        # A stream can't be shared, and only its first chunk is protected by retries
+        if stream:
+            return self._call(prompt, stream=True, **kwargs)
+
+        key = (prompt, repr(sorted(kwargs.items())))
+        with self._in_flight_lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = Future()
+        if not leader:
+            with span("model.call", bytes=len(str(prompt)), shared=True):
+                return call.result()
+
+        try:
+            call.set_result(self._call(prompt, **kwargs))
+        except BaseException as e:
+            call.set_exception(e)
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[key]
+        return call.result()
+
+    def _call(self, prompt, **kwargs):
+        if self.timeout:
+            kwargs.setdefault("request_options", {"timeout": self.timeout})
+        with span("model.call", bytes=len(str(prompt))) as s:
+            waited = 0.0
+            for attempt in range(self.retries + 1):
+                if not self.breaker.allow():
+                    s.set(attempts=attempt)
+                    raise ModelUnavailableError(
+                        f"Model unavailable after repeated failures; retrying in {self.breaker.cooldown:.0f}s"
+                    )
+                if self.bucket is not None:
+                    waited += self.bucket.acquire()
+                try:
+                    response = self.model.generate_content(prompt, **kwargs)
+                except Exception as e:
+                    if not is_transient(e):
+                        # The service answered, so it is up
+                        self.breaker.success()
+                        raise
+                    if getattr(e, "code", None) == 429:
+                        # Over quota rather than down: slow everyone down instead of opening the circuit
+                        if self.bucket is not None:
+                            self.bucket.drain()
+                    else:
+                        self.breaker.failure()
+                    s.set(attempts=attempt + 1, retried=type(e).__name__, wait_ms=round(waited * 1000, 3))
+                    if attempt == self.retries:
+                        raise
+                    delay = backoff(attempt)
+                    time.sleep(delay)
+                    waited += delay
+                    continue
+                self.breaker.success()
+                s.set(attempts=attempt + 1, wait_ms=round(waited * 1000, 3))
+                return response
+
+
+def get_model():
+    """
+    Shared Gemini model used by every screen.
+
+    The client library is imported and configured on first use, so pages
+    that never call the model don't pay for it and a missing API key only
+    fails the request that needs it. The model is wrapped in a
+    ResilientModel, so every caller shares its rate limit and breaker.
+    """
+    global _model
+    with _model_lock:
+        if _model is None:
+            # Load environment variables
+            load_dotenv()
+
+            # Configure Gemini API
+            api_key = os.getenv('GEMINI_API_KEY')
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY not found in environment variables")
+
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            _model = ResilientModel(genai.GenerativeModel(MODEL_NAME))
+        return _model
+
+
+def set_model(model):
+    """Use ``model`` in place of Gemini, e.g. a FakeModel for offline runs and benchmarks."""
+    global _model
+    with _model_lock:
+        _model = model if model is None or isinstance(model, ResilientModel) else ResilientModel(model)
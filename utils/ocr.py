@@ -0,0 +1,210 @@
+import io
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageSequence
+
+from utils.cache import hash_bytes, make_key
+from utils.ocr_engine import get_engine, resolve_engine_name
+from utils.preprocess import OCR_PRESET, get_preset, preprocess
+from utils.tracing import record
+
+# Resolution PDF pages are rasterized at
+PDF_DPI = int(os.getenv("STREAMLINE_PDF_DPI", "300"))
+
+# Tesseract's page separator; multi-page documents join their pages' text with it
+PAGE_BREAK = "\f"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def extract_text_from_image(image, preset=None):
+    """Extract text from an image using OCR, after the preset's preprocessing."""
+    image, config = preprocess(image, preset)
+    return get_engine().image_to_string(image, config)
+
+
+def is_pdf(data):
+    return data[:1024].lstrip().startswith(b"%PDF")
+
+
+def iter_pages(data):
+    """
+    Yield the pages of a document as images, one at a time.
+
+    PDFs are rasterized at PDF_DPI with pypdfium2 (imported on the first
+    PDF, so image-only callers don't load it), and multi-page TIFFs are read frame by frame, so only the current
+    page's bitmap is held in memory. Other images are a single page.
+    """
+    if is_pdf(data):
+        try:
+            import pypdfium2 as pdfium
+        except ImportError:
+            raise RuntimeError(
+                "pypdfium2 is missing from this environment; reinstall the requirements: "
+                "pip install -r requirements.txt"
+            ) from None
+        pdf = pdfium.PdfDocument(data)
+        try:
+            for index in range(len(pdf)):
+                page = pdf[index]
+                try:
+                    image = page.render(scale=PDF_DPI / 72).to_pil()
+                finally:
+                    page.close()
+                image.info["dpi"] = (PDF_DPI, PDF_DPI)
+                yield image
+        finally:
+            pdf.close()
+        return
+
+    with Image.open(io.BytesIO(data)) as image:
+        # ImageSequence seeks the open file, decoding one frame at a time
+        yield from ImageSequence.Iterator(image)
+
+
+def iter_page_text(data, preset=None):
+    """OCR a document page by page, yielding each page's text."""
+    for page in iter_pages(data):
+        yield extract_text_from_image(page, preset).strip(PAGE_BREAK + "\n ")
+
+
+def extract_text_from_bytes(data, preset=None):
+    """Extract text from a document's raw bytes using OCR, pages separated by PAGE_BREAK."""
+    return PAGE_BREAK.join(iter_page_text(data, preset))
+
+
+def _extract_timed(data):
+    """OCR in a worker, returning the text and the time taken in milliseconds."""
+    start = time.perf_counter()
+    text = extract_text_from_bytes(data)
+    return text, (time.perf_counter() - start) * 1000
+
+
+def default_worker_count():
+    """Number of OCR worker processes to use (one per CPU core)."""
+    return os.cpu_count() or 1
+
+
+def _start_worker():
+    """Initialize the OCR engine as a worker starts, so documents don't wait for it."""
+    get_engine()
+
+
+def get_pool():
+    """
+    Long-lived OCR worker pool shared by every caller in the process.
+
+    Workers keep their initialized engine between batches, so only the
+    first documents after startup pay for loading it.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=default_worker_count(), initializer=_start_worker)
+        return _pool
+
+
+def discard_pool(pool):
+    """Drop a pool broken by a crashed worker; the next ``get_pool`` starts a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def ocr_cache_key(data, preset=None):
+    """Cache key for the OCR text of an image; changing the engine or the preset's settings invalidates it."""
+    preset = preset or OCR_PRESET
+    return make_key("ocr", resolve_engine_name(), preset, sorted(get_preset(preset).items()), hash_bytes(data))
+
+
+def ocr_many(documents, max_workers=None, cache=None):
+    """
+    OCR several documents in parallel on the shared worker pool.
+
+    Args:
+        documents (dict): Mapping of document name to raw image bytes
+        max_workers (int): Upper bound on documents OCR'd at once, defaults to the CPU count
+        cache (DiskCache): Optional cache of OCR text keyed by image hash
+
+    Yields:
+        (name, text, error) tuples in completion order. ``error`` is None on success.
+    """
+    keys = {}
+    if cache is not None:
+        # Serve previously OCR'd images straight from the cache
+        pending = {}
+        for name, data in documents.items():
+            start = time.perf_counter()
+            keys[name] = ocr_cache_key(data)
+            text = cache.get(keys[name])
+            if text is None:
+                pending[name] = data
+            else:
+                record("ocr", (time.perf_counter() - start) * 1000, document=name, bytes=len(data), cache_hit=True)
+                yield name, text, None
+        documents = pending
+
+    for name, result, error in _ocr_uncached(documents, max_workers):
+        text = None
+        if error is None:
+            text, elapsed_ms = result
+            record("ocr", elapsed_ms, document=name, bytes=len(documents[name]), cache_hit=False, chars=len(text))
+            if cache is not None:
+                cache.set(keys[name], text)
+        yield name, text, error
+
+
+def _ocr_uncached(documents, max_workers):
+    if not documents:
+        return
+
+    workers = min(max_workers or default_worker_count(), len(documents))
+
+    # A single document (or a single core) is not worth a process pool
+    if workers <= 1:
+        for name, data in documents.items():
+            try:
+                yield name, _extract_timed(data), None
+            except Exception as e:
+                yield name, None, e
+        return
+
+    pool = get_pool()
+    pending = iter(documents.items())
+    in_flight = {}
+    broken = None
+    while True:
+        # Keep at most ``workers`` documents in flight on the shared pool
+        while broken is None and len(in_flight) < workers:
+            name, data = next(pending, (None, None))
+            if name is None:
+                break
+            try:
+                in_flight[pool.submit(_extract_timed, data)] = name
+            except BrokenProcessPool as e:
+                broken = e
+                discard_pool(pool)
+                yield name, None, e
+        if not in_flight:
+            break
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = in_flight.pop(future)
+            try:
+                yield name, future.result(), None
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool) and broken is None:
+                    broken = e
+                    discard_pool(pool)
+                yield name, None, e
+
+    # A crashed worker breaks the pool; documents not yet submitted fail with it
+    for name, _ in pending:
+        yield name, None, broken
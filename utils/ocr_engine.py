@@ -0,0 +1,158 @@
+"""
+OCR engines behind ``utils.ocr.extract_text_from_image``.
+
+pytesseract runs the tesseract command for every image: it writes the
+image to a temporary file, starts a process that loads the language data
+from disk and reads the text back from another file. tesserocr links
+Tesseract into the process instead, so initialized instances are kept
+alive and images are handed over in memory. It is used when installed
+(``pip install tesserocr``), with pytesseract as the fallback.
+"""
+import functools
+import importlib.util
+import os
+import queue
+import shlex
+import threading
+import warnings
+
+import pytesseract
+
+# "auto" (tesserocr when available), "tesserocr" or "pytesseract"
+OCR_ENGINE = os.getenv("STREAMLINE_OCR_ENGINE", "auto")
+OCR_LANG = os.getenv("STREAMLINE_OCR_LANG", "eng")
+
+# Tesseract's default page segmentation mode: fully automatic
+DEFAULT_PSM = 3
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def parse_config(config):
+    """(page segmentation mode, {variable: value}) from a tesseract command-line config."""
+    args = shlex.split(config or "")
+    psm, variables = DEFAULT_PSM, {}
+    for flag, value in zip(args, args[1:]):
+        if flag == "--psm":
+            psm = int(value)
+        elif flag == "-c":
+            name, _, setting = value.partition("=")
+            variables[name] = setting
+    return psm, variables
+
+
+class PytesseractEngine:
+    """One tesseract process per image."""
+
+    name = "pytesseract"
+
+    def image_to_string(self, image, config=""):
+        return pytesseract.image_to_string(image, lang=OCR_LANG, config=config)
+
+
+class TesserocrEngine:
+    """
+    In-process Tesseract through tesserocr.
+
+    Initialized instances are pooled: a caller borrows an idle one (or
+    initializes a new one when all are busy) and returns it afterwards, so
+    the language data is loaded once per concurrent caller, not per image.
+    Instances aren't thread-safe, and are never shared between threads.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, lang=OCR_LANG):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self.lang = lang
+        self._idle = queue.LifoQueue()
+        # Fail now, rather than on the first document, when the language data is missing
+        self._idle.put(self._new_api())
+
+    def _new_api(self):
+        return self._tesserocr.PyTessBaseAPI(lang=self.lang)
+
+    def image_to_string(self, image, config=""):
+        psm, variables = parse_config(config)
+        try:
+            api = self._idle.get_nowait()
+        except queue.Empty:
+            api = self._new_api()
+        try:
+            api.SetPageSegMode(psm)
+            for name, value in variables.items():
+                api.SetVariable(name, value)
+            api.SetImage(image)
+            text = api.GetUTF8Text()
+        except Exception:
+            api.End()
+            raise
+        if variables:
+            # Variables stick to the instance, so don't hand it to the next caller
+            api.End()
+        else:
+            api.Clear()
+            self._idle.put(api)
+        return text
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().End()
+            except queue.Empty:
+                return
+
+
+def _check_name(name):
+    if name not in ("auto", "tesserocr", "pytesseract"):
+        raise ValueError(f"Unknown OCR engine {name!r}; choose auto, tesserocr or pytesseract")
+
+
+@functools.lru_cache(maxsize=None)
+def _tesserocr_installed():
+    return importlib.util.find_spec("tesserocr") is not None
+
+
+def make_engine(name=OCR_ENGINE):
+    """Create an engine by name, falling back to pytesseract when tesserocr can't be used."""
+    _check_name(name)
+    if name != "pytesseract":
+        try:
+            return TesserocrEngine()
+        except (ImportError, RuntimeError) as e:
+            if name == "tesserocr":
+                warnings.warn(f"tesserocr is unavailable ({e}); using pytesseract")
+    return PytesseractEngine()
+
+
+def get_engine():
+    """Process-wide OCR engine, created on first use so its instances live as long as the process."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = make_engine()
+        return _engine
+
+
+def resolve_engine_name(name=OCR_ENGINE):
+    """
+    Name of the engine OCR uses in this process, without creating one.
+
+    Processes that only dispatch OCR to workers (the Streamlit app) need
+    the name for cache keys but shouldn't load Tesseract for it.
+    """
+    if _engine is not None:
+        return _engine.name
+    _check_name(name)
+    if name != "pytesseract" and _tesserocr_installed():
+        return "tesserocr"
+    return "pytesseract"
+
+
+def set_engine(engine):
+    """Use ``engine`` for OCR in this process, e.g. to compare engines in a benchmark."""
+    global _engine
+    with _engine_lock:
+        _engine = engine
@@ -0,0 +1,176 @@
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import storage
+
+PENDING = "Pending"
+SUBMITTED = "Submitted"
+SUCCESSFUL = "Successful"
+FAILED = "Failed"
+
+# Allowed state changes: state -> states it may move to
+TRANSITIONS = {
+    PENDING: {SUBMITTED},
+    SUBMITTED: {SUCCESSFUL, FAILED, PENDING},
+    FAILED: {PENDING},
+    SUCCESSFUL: set(),
+}
+
+PAYMENT_WORKERS = int(os.getenv("STREAMLINE_PAYMENT_WORKERS", "8"))
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 30
+
+# A Submitted job whose engine hasn't touched it for this long is presumed
+# abandoned and handed to another engine. Engines renew the lease before
+# every attempt, so this only needs to exceed one gateway call.
+LEASE_SECONDS = int(os.getenv("STREAMLINE_PAYMENT_LEASE_SECONDS", "600"))
+
+
+class PaymentError(Exception):
+    """Raised by a gateway when a payment fails. ``retryable`` errors are retried."""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class PaymentGateway:
+    """Interface for payment providers."""
+
+    def pay(self, idempotency_key, invoice_id, amount):
+        """
+        Pay an invoice and return the provider's payment reference.
+
+        Calls with the same ``idempotency_key`` must not pay twice.
+        Raise PaymentError on failure.
+        """
+        raise NotImplementedError
+
+
+class StubGateway(PaymentGateway):
+    """Local gateway that simulates latency and transient failures."""
+
+    def __init__(self, latency=0.05, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._payments = {}
+        self._lock = threading.Lock()
+
+    def pay(self, idempotency_key, invoice_id, amount):
+        time.sleep(self.latency)
+        with self._lock:
+            if idempotency_key in self._payments:
+                return self._payments[idempotency_key]
+            if random.random() < self.failure_rate:
+                raise PaymentError("Simulated gateway timeout")
+            reference = uuid.uuid4().hex
+            self._payments[idempotency_key] = reference
+            return reference
+
+
+def backoff_delay(attempt, base=BACKOFF_SECONDS, cap=MAX_BACKOFF_SECONDS):
+    """Exponential backoff with full jitter for the given (1-based) attempt."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def transition(key, to_state, **kwargs):
+    """Apply a state change allowed by TRANSITIONS. Returns False if the job was elsewhere."""
+    from_states = [state for state, targets in TRANSITIONS.items() if to_state in targets]
+    return storage.transition_payment(key, from_states, to_state, **kwargs)
+
+
+class PaymentEngine:
+    """
+    Background payment processor.
+
+    Submitted invoices become persisted payment jobs that a thread pool works
+    through: Pending -> Submitted -> Successful/Failed, retrying transient
+    gateway errors with backoff. Jobs whose engine stopped mid-payment are
+    picked up again once their lease has expired, when an engine starts or
+    new payments are submitted, so engines in other processes keep theirs.
+    """
+
+    def __init__(self, gateway=None, workers=PAYMENT_WORKERS, max_attempts=MAX_ATTEMPTS, lease_seconds=LEASE_SECONDS):
+        self.gateway = gateway or StubGateway()
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="payment")
+        self._queued = set()
+        self._lock = threading.Lock()
+        self.recover()
+
+    def submit(self, invoice_ids):
+        """Queue payments for invoice lines and return the number of jobs queued."""
+        keys = storage.create_payments(invoice_ids)
+        jobs = storage.read_payment_jobs([PENDING])
+        jobs = jobs[jobs["idempotency_key"].isin(keys)]
+        queued = self._enqueue(jobs)
+        self.recover()
+        return queued
+
+    def recover(self):
+        """Re-queue Pending jobs and those whose engine's lease expired (it crashed or was restarted)."""
+        storage.requeue_stale_payments(self.lease_seconds)
+        return self._enqueue(storage.read_payment_jobs([PENDING]))
+
+    def _enqueue(self, jobs):
+        queued = 0
+        for job in jobs.itertuples(index=False):
+            with self._lock:
+                if job.idempotency_key in self._queued:
+                    continue
+                self._queued.add(job.idempotency_key)
+            self._executor.submit(self._process, job.idempotency_key, job.invoice_id, job.amount)
+            queued += 1
+        return queued
+
+    def _process(self, key, invoice_id, amount):
+        try:
+            # Another worker or process may already own the job
+            if not transition(key, SUBMITTED, attempt=True):
+                return
+            for attempt in range(1, self.max_attempts + 1):
+                if attempt > 1:
+                    storage.renew_payment(key)
+                try:
+                    reference = self.gateway.pay(key, invoice_id, amount)
+                except PaymentError as e:
+                    if not e.retryable or attempt == self.max_attempts:
+                        transition(key, FAILED, error=f"{e} (attempt {attempt})")
+                        return
+                    time.sleep(backoff_delay(attempt))
+                except Exception as e:
+                    transition(key, FAILED, error=f"Gateway error: {e}")
+                    return
+                else:
+                    transition(key, SUCCESSFUL, reference=reference)
+                    return
+        finally:
+            with self._lock:
+                self._queued.discard(key)
+
+    def pending_count(self):
+        """Jobs queued in this process that have not finished."""
+        with self._lock:
+            return len(self._queued)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_payment_engine():
+    """Process-wide payment engine shared by all sessions."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = PaymentEngine()
+        return _engine
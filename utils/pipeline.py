@@ -0,0 +1,486 @@
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from utils import duplicates, storage
+from utils.cache import get_cache, make_key
+from utils.dates import to_iso
+from utils.json_stream import JsonItemStream
+from utils.invoice_parser import CONFIDENCE_THRESHOLD, learn_template, parse_invoice, vendor_key
+from utils.model_client import MODEL_NAME, get_model
+from utils.ocr import PAGE_BREAK, extract_text_from_bytes, ocr_cache_key
+from utils.similarity_checker import MATCHING_ENGINE, build_goal_index, verify_items_against_goals
+from utils.tracing import record_usage, span
+
+EXTRACTION_PROMPT = """
+    You are an invoice analysis expert. Given the following invoice text, extract:
+    1. Invoice number
+    2. Invoice date
+    3. All items with their descriptions, quantities, and prices
+    4. Subtotal, tax (if present), and total amount
+    5. Categorize the type of product
+
+    Return the data in this JSON format:
+    {
+        "invoice_info": {
+            "number": "invoice number",
+            "date": "invoice date"
+        },
+        "items": [
+            {
+                "description": "full item description",
+                "quantity": number,
+                "price": number,
+                "total": number,
+                "category": "product category"
+            }
+        ],
+        "summary": {
+            "subtotal": number,
+            "tax": number,
+            "total": number
+        }
+    }
+
+    Invoice text:
+    """
+
+# Stream the model's answer on the Upload page by default
+STREAM_EXTRACTION = os.getenv("STREAMLINE_STREAM_EXTRACTION", "1") != "0"
+
+# Items verified concurrently while a streamed response is still arriving
+STREAM_VERIFY_WORKERS = int(os.getenv("STREAMLINE_STREAM_VERIFY_WORKERS", "4"))
+
+# Longer documents are extracted a few pages at a time, so prompts stay
+# well inside the model's context window
+MAX_CHUNK_CHARS = int(os.getenv("STREAMLINE_MAX_CHUNK_CHARS", "12000"))
+
+
+def extract_text(data, name=None):
+    """OCR a document's raw bytes page by page, reusing the cached text of identical documents."""
+    cache = get_cache()
+    cache_key = ocr_cache_key(data)
+    with span("ocr", document=name, bytes=len(data)) as s:
+        text = cache.get(cache_key)
+        s.set(cache_hit=text is not None)
+        if text is None:
+            text = extract_text_from_bytes(data)
+            cache.set(cache_key, text)
+        s.set(pages=text.count(PAGE_BREAK) + 1)
+    return text
+
+
+def text_chunks(text, max_chars=None):
+    """Split OCR text into chunks of whole pages of at most ``max_chars`` (MAX_CHUNK_CHARS) characters."""
+    max_chars = max_chars or MAX_CHUNK_CHARS
+    chunk, size = [], 0
+    for page in text.split(PAGE_BREAK):
+        # A page too long for one chunk is split between lines
+        parts = page.splitlines(keepends=True) if len(page) > max_chars else [page + PAGE_BREAK]
+        for part in parts:
+            if chunk and size + len(part) > max_chars:
+                yield "".join(chunk).rstrip(PAGE_BREAK)
+                chunk, size = [], 0
+            chunk.append(part)
+            size += len(part)
+    if chunk:
+        yield "".join(chunk).rstrip(PAGE_BREAK)
+
+
+def analyze_with_gemini(text):
+    """Use Gemini API to extract structured information from text."""
+    prompt = EXTRACTION_PROMPT + text
+
+    with span("extract.model", bytes=len(prompt)) as s:
+        # The prompt embeds the OCR text, so identical documents share a key
+        cache = get_cache()
+        cache_key = make_key("extract", MODEL_NAME, prompt)
+        cached = cache.get(cache_key)
+        s.set(cache_hit=cached is not None)
+        if cached is not None:
+            return cached
+
+        response = get_model().generate_content(prompt)
+        record_usage(s, response)
+        json_str = response.text
+        if '```json' in json_str:
+            json_str = json_str.split('```json')[1].split('```')[0]
+        data = json.loads(json_str.strip())
+        cache.set(cache_key, data)
+        return data
+
+
+def analyze_with_gemini_stream(text, on_items):
+    """
+    Like ``analyze_with_gemini``, but stream the response and call
+    ``on_items(items, fields)`` with the line items each chunk completes,
+    as soon as their JSON objects have closed. ``fields`` holds the
+    top-level fields received so far.
+    """
+    prompt = EXTRACTION_PROMPT + text
+
+    with span("extract.model", bytes=len(prompt), stream=True) as s:
+        cache = get_cache()
+        cache_key = make_key("extract", MODEL_NAME, prompt)
+        cached = cache.get(cache_key)
+        s.set(cache_hit=cached is not None)
+        if cached is not None:
+            on_items(cached["items"], cached)
+            return cached
+
+        started = time.perf_counter()
+        parser = JsonItemStream("items")
+        response = get_model().generate_content(prompt, stream=True)
+        first_item = True
+        for chunk in response:
+            items = parser.feed(chunk.text)
+            if items:
+                if first_item:
+                    s.set(first_item_ms=round((time.perf_counter() - started) * 1000, 3))
+                    first_item = False
+                on_items(items, parser.fields)
+        record_usage(s, response)
+        data = parser.result()
+        cache.set(cache_key, data)
+        return data
+
+
+def extract_invoice_data(text, on_items=None, vendor=None, learn=True):
+    """
+    Extract structured invoice data, trying the local parser before Gemini.
+
+    Known vendors are parsed with their learned template. The model is only
+    called when the parser is not confident, and its answer is used to learn
+    (or refresh) the vendor's template unless ``learn`` is False. With
+    ``on_items`` the model's answer is streamed and ``on_items(items, fields)``
+    is called with line items as they arrive. ``vendor`` defaults to the
+    one named in the text's header.
+    """
+    vendor = vendor_key(text) if vendor is None else vendor
+    with span("extract.parser", bytes=len(text)) as s:
+        template = storage.get_vendor_template(vendor) if vendor else None
+        data, confidence = parse_invoice(text, template)
+        s.set(confidence=confidence, template=template is not None)
+    if confidence >= CONFIDENCE_THRESHOLD:
+        data["extraction"] = {"method": "parser", "confidence": confidence}
+        if on_items is not None:
+            on_items(data["items"], data)
+        return data
+
+    data = analyze_with_gemini(text) if on_items is None else analyze_with_gemini_stream(text, on_items)
+    if vendor and learn:
+        storage.save_vendor_template(vendor, learn_template(text, data))
+    data["extraction"] = {"method": "model", "confidence": confidence}
+    return data
+
+
+def merge_extractions(parts):
+    """
+    Combine the extractions of a document's chunks into one invoice: the
+    header of the first chunk that has one, every chunk's items in order
+    and the totals of the last chunk that has them.
+    """
+    data = {"invoice_info": {}, "items": [], "summary": {}}
+    for part in parts:
+        for key, value in (part.get("invoice_info") or {}).items():
+            if value and not data["invoice_info"].get(key):
+                data["invoice_info"][key] = value
+        data["items"] += part.get("items") or []
+        summary = part.get("summary") or {}
+        if summary.get("total"):
+            data["summary"] = summary
+    methods = {part["extraction"]["method"] for part in parts}
+    data["extraction"] = {
+        "method": "model" if "model" in methods else "parser",
+        "confidence": min(part["extraction"]["confidence"] for part in parts),
+        "chunks": len(parts),
+    }
+    return data
+
+
+def _with_header(on_items, invoice_info):
+    """Report a continuation chunk's items with the invoice header of the earlier chunks."""
+    return lambda items, fields: on_items(items, {**fields, "invoice_info": invoice_info})
+
+
+def extract_document(text, on_items=None):
+    """
+    Extract a whole OCR'd document, a chunk of MAX_CHUNK_CHARS at a time.
+
+    Short documents go straight to ``extract_invoice_data``. Longer ones
+    are extracted chunk by chunk, with the later chunks parsed with the
+    first page's vendor template (without relearning it from a
+    continuation page), and the results merged. Streamed items of later
+    chunks are reported with the invoice header found so far.
+    """
+    if len(text) <= MAX_CHUNK_CHARS:
+        return extract_invoice_data(text, on_items)
+
+    parts, vendor = [], None
+    for chunk in text_chunks(text):
+        received, first = on_items, not parts
+        if on_items is not None and not first:
+            received = _with_header(on_items, merge_extractions(parts)["invoice_info"])
+        if first:
+            vendor = vendor_key(chunk)
+        with span("extract.chunk", chunk=len(parts), bytes=len(chunk)):
+            parts.append(extract_invoice_data(chunk, received, vendor, learn=first))
+    return merge_extractions(parts)
+
+
+def check_item(item, verdict, company_goals):
+    """
+    Apply a goal match verdict and the goal's quantity limit to one item.
+
+    Returns (is_suspicious, messages).
+    """
+    messages = []
+    # Default to suspicious
+    is_suspicious = True
+
+    try:
+        if not company_goals.empty:
+            is_suspicious, matched_goal = verdict
+
+            if is_suspicious:
+                messages.append(("warning", f"⚠️ Suspicious item detected: {item['description']}"))
+            else:
+                # Find matching goal details
+                goal_row = company_goals[company_goals['Goals'].str.lower() == matched_goal.lower()]
+                if not goal_row.empty:
+                    messages.append(("success", f"✅ Item '{item['description']}' matches goal: {matched_goal}"))
+
+                    # Check quantity against goal
+                    goal_quantity = goal_row.iloc[0]['Number of Items']
+                    if pd.notna(goal_quantity) and item['quantity'] > goal_quantity:
+                        messages.append((
+                            "warning", f"⚠️ Quantity ({item['quantity']}) exceeds goal quantity ({goal_quantity})"
+                        ))
+                        is_suspicious = True
+        else:
+            messages.append(("warning", "No company goals defined - all items will be marked as suspicious"))
+            is_suspicious = True
+
+    except Exception as e:
+        messages.append(("error", f"Error checking item: {str(e)}"))
+        is_suspicious = True
+    return is_suspicious, messages
+
+
+def invoice_row(data, item, is_suspicious, department=None):
+    """One invoice line ready to save; invoice fields not yet extracted are left empty."""
+    info = data.get('invoice_info', {})
+    summary = data.get('summary', {})
+    return {
+        "Invoice Number": info.get('number'),
+        "Due Date": to_iso(info.get('date')) or info.get('date'),
+        "Description": item['description'],
+        "Quantity": item['quantity'],
+        "Price": item['price'],
+        "Subtotal": summary.get('subtotal'),
+        "Tax": summary.get('tax', 0),
+        "Total": summary.get('total'),
+        "Category": item['category'],
+        "Suspicious": is_suspicious,
+        "Department": department
+    }
+
+
+def verify_invoice(data, company_goals, department=None):
+    """
+    Check every item of an extracted invoice against company goals.
+
+    Returns (rows, messages): invoice lines ready to save, with their
+    Suspicious flag set, and (level, text) findings for the user where
+    level is "success", "warning" or "error".
+    """
+    rows, messages = [], []
+
+    # Check every item against goals with a few batched model requests
+    verification = [None] * len(data['items'])
+    if not company_goals.empty:
+        try:
+            with span("verify", items=len(data['items'])):
+                verification = verify_items_against_goals(
+                    [item['description'] for item in data['items']],
+                    company_goals['Goals'].tolist(),
+                    get_model()
+                )
+        except Exception as e:
+            messages.append(("error", f"Error checking items: {str(e)}"))
+            verification = [(True, "Error checking")] * len(data['items'])
+
+    for item, verdict in zip(data['items'], verification):
+        is_suspicious, item_messages = check_item(item, verdict, company_goals)
+        messages += item_messages
+        rows.append(invoice_row(data, item, is_suspicious, department))
+    return rows, messages
+
+
+def stream_verify_invoice(text, company_goals, department=None, on_item=None, skip_duplicates=False):
+    """
+    Extract an invoice from a streamed model response, verifying each item
+    against company goals as soon as it has been received.
+
+    The items completed by each response chunk are verified together on
+    one of STREAM_VERIFY_WORKERS threads while the rest of the response is
+    still arriving. ``on_item(row, messages)`` is called
+    for every verified line in invoice order; the row's invoice totals are
+    empty because the model sends them last.
+
+    With ``skip_duplicates`` no item is verified until the invoice header
+    has arrived and its number and date are not already recorded. Items of
+    a header that is recorded wait for the total, and an invoice that then
+    matches a recorded one exactly is returned without verifying anything.
+
+    Returns (data, rows, messages); rows and messages are None for a
+    skipped duplicate.
+    """
+    goals, model = None, None
+    if not company_goals.empty:
+        model = get_model()
+        goal_list = company_goals['Goals'].tolist()
+        # Build the shared goal index here rather than racing to build it in every thread
+        goals = goal_list if MATCHING_ENGINE == "vector" else build_goal_index(goal_list, model)
+    workers = 1 if MATCHING_ENGINE == "vector" else STREAM_VERIFY_WORKERS
+
+    pending = deque()
+    verified, messages = [], []
+
+    def finish(block):
+        """Report verified items in order, waiting for all of them if ``block``."""
+        while pending and (block or pending[0][1] is None or pending[0][1].done()):
+            items, future, fields = pending.popleft()
+            batch_messages, verdicts = [], [None] * len(items)
+            if future is not None:
+                try:
+                    verdicts = future.result()
+                except Exception as e:
+                    batch_messages.append(("error", f"Error checking items: {str(e)}"))
+                    verdicts = [(True, "Error checking")] * len(items)
+            for item, verdict in zip(items, verdicts):
+                is_suspicious, item_messages = check_item(item, verdict, company_goals)
+                item_messages = batch_messages + item_messages
+                batch_messages = []
+                verified.append((item, is_suspicious))
+                messages.extend(item_messages)
+                if on_item is not None:
+                    on_item(invoice_row(fields, item, is_suspicious, department), item_messages)
+
+    # Batches waiting for the duplicate check; ``recorded`` is None until the header arrives
+    held, recorded = [], None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit(items, fields):
+            future = None
+            if goals is not None:
+                future = pool.submit(verify_items_against_goals, [item['description'] for item in items], goals, model)
+            pending.append((items, future, fields))
+
+        def received(items, fields):
+            nonlocal recorded
+            if skip_duplicates:
+                if recorded is None and "invoice_info" in fields:
+                    with span("duplicates.header"):
+                        recorded = duplicates.header_recorded(fields["invoice_info"])
+                if recorded is not False:
+                    held.append(items)
+                    return
+            while held:
+                submit(held.pop(0), fields)
+            submit(items, fields)
+            finish(block=False)
+
+        with span("extract", stream=True) as s:
+            data = extract_document(text, received)
+            s.set(method=data["extraction"]["method"], items=len(data["items"]), held=len(held))
+        if held:
+            with span("duplicates.invoice"):
+                if duplicates.find_duplicate_invoice(data) is not None:
+                    return data, None, None
+            for items in held:
+                submit(items, data)
+        with span("verify", items=len(data["items"]), stream=True):
+            finish(block=True)
+
+    rows = [invoice_row(data, item, is_suspicious, department) for item, is_suspicious in verified]
+    return data, rows, messages
+
+
+def process_text(text, company_goals, department=None, document=None, allow_duplicates=False, on_item=None):
+    """
+    Extract, verify and save one OCR'd invoice.
+
+    Invoices already recorded with the same number, date and total are
+    skipped before verification unless ``allow_duplicates``. ``document``
+    is the source file's fingerprint, remembered once processed.
+
+    With ``on_item`` the model's answer is streamed and every item is
+    verified as it arrives (see ``stream_verify_invoice``). Items are held
+    back while the streamed header's number and date match a recorded
+    invoice, so a duplicate is still skipped before verification.
+
+    Returns a dict with the extraction ``data``, the saved ``rows`` and
+    their ``ids``, user-facing ``messages`` and the ``duplicate`` match.
+    """
+    streamed = None
+    if on_item is None:
+        with span("extract") as s:
+            data = extract_document(text)
+            s.set(method=data["extraction"]["method"], items=len(data["items"]))
+    else:
+        data, *streamed = stream_verify_invoice(text, company_goals, department, on_item, not allow_duplicates)
+    result = {"data": data, "rows": [], "ids": [], "messages": [], "duplicate": None}
+
+    invoice_key = duplicates.invoice_key_of(data)
+    with span("duplicates.invoice"):
+        result["duplicate"] = duplicates.find_duplicate_invoice(data)
+    if result["duplicate"] is not None:
+        result["messages"].append(("warning", f"⚠️ Duplicate invoice: {duplicates.describe(result['duplicate'])}"))
+        if not allow_duplicates:
+            if document is not None:
+                duplicates.record_document(document, invoice_key)
+            return result
+
+    if streamed is None or streamed[0] is None:
+        result["rows"], messages = verify_invoice(data, company_goals, department)
+    else:
+        result["rows"], messages = streamed
+    result["messages"] += messages
+
+    # Save to the database
+    with span("save", rows=len(result["rows"])):
+        result["ids"] = storage.insert_invoice_rows(result["rows"])
+    if document is not None:
+        duplicates.record_document(document, invoice_key)
+    return result
+
+
+def process_document(data, name=None, company_goals=None, department=None, allow_duplicates=False):
+    """
+    Run the whole pipeline on one document's bytes: duplicate check, OCR,
+    extraction, goal verification and save.
+
+    Returns the ``process_text`` result with the OCR ``text``, or a result
+    with only ``duplicate`` set when the file itself was seen before.
+    """
+    with span("document", document=name, bytes=len(data)):
+        document = duplicates.fingerprint(data, name)
+        with span("duplicates.document"):
+            match = duplicates.find_duplicate_document(document)
+        if match is not None and not allow_duplicates:
+            return {"data": None, "rows": [], "ids": [], "messages": [], "duplicate": match, "text": None}
+
+        text = extract_text(data, name)
+        if not text.strip():
+            return {"data": None, "rows": [], "ids": [], "messages": [("warning", "No text found")], "duplicate": None, "text": text}
+
+        if company_goals is None:
+            company_goals = storage.read_goals()
+        result = process_text(text, company_goals, department, document, allow_duplicates)
+        result["text"] = text
+        return result
@@ -0,0 +1,124 @@
+"""
+Column types of the frames the storage layer hands to the screens.
+
+Every loader converts its columns with ``apply_schema`` so screens work on
+native dtypes: categoricals for repeated labels, nullable booleans for
+flags, floats for money and datetime64 for due dates. Set
+STREAMLINE_DTYPE_BACKEND=pyarrow to back the frames with Arrow arrays.
+"""
+import os
+import warnings
+
+import pandas as pd
+
+from utils.dates import parse_dates
+
+DTYPE_BACKEND = os.getenv("STREAMLINE_DTYPE_BACKEND", "numpy")
+
+# Display column -> kind of value it holds
+INVOICE_SCHEMA = {
+    "Invoice Number": "category",
+    "Due Date": "date",
+    "Description": "text",
+    "Quantity": "number",
+    "Price": "money",
+    "Subtotal": "money",
+    "Tax": "money",
+    "Total": "money",
+    "Category": "category",
+    "Verified": "flag",
+    "Suspicious": "flag",
+    "Department": "category",
+}
+
+AP_SCHEMA = {
+    "Id": "id",
+    "Invoice Number": "category",
+    "Due Date": "date",
+    "Price": "money",
+    "Total": "money",
+    "Category": "category",
+    "Verified": "flag",
+    "Payment Overdue": "flag",
+    "Payment Status": "category",
+}
+
+GOAL_SCHEMA = {
+    "Goals": "text",
+    "Number of Items": "count",
+    "Outcomes": "text",
+    "Due Date": "text",
+    "Key Results": "text",
+}
+
+ROLLUP_SCHEMA = {
+    "Month": "category",
+    "Category": "category",
+    "Total": "money",
+    "Paid": "money",
+    "Lines": "count",
+}
+
+NUMPY_DTYPES = {
+    "id": "int64",
+    "count": "Int64",
+    "number": "float64",
+    "money": "float64",
+    "text": "string",
+    "category": "category",
+    "flag": "boolean",
+    "date": "datetime64[ns]",
+}
+
+FLAG_VALUES = {"true": True, "yes": True, "1": True, "false": False, "no": False, "0": False}
+
+
+def _arrow_dtypes():
+    import pyarrow as pa
+    return {
+        "id": pd.ArrowDtype(pa.int64()),
+        "count": pd.ArrowDtype(pa.int64()),
+        "number": pd.ArrowDtype(pa.float64()),
+        "money": pd.ArrowDtype(pa.float64()),
+        "text": pd.ArrowDtype(pa.string()),
+        "category": pd.ArrowDtype(pa.dictionary(pa.int32(), pa.string())),
+        "flag": pd.ArrowDtype(pa.bool_()),
+        "date": pd.ArrowDtype(pa.timestamp("ns")),
+    }
+
+
+def dtypes(backend=None):
+    """Kind -> dtype for a backend ("numpy" or "pyarrow")."""
+    if (backend or DTYPE_BACKEND) == "pyarrow":
+        try:
+            return _arrow_dtypes()
+        except ImportError:
+            warnings.warn("pyarrow is not installed; using numpy-backed dtypes")
+    return NUMPY_DTYPES
+
+
+def to_flags(values):
+    """Nullable booleans from 0/1, True/False or "Yes"/"No" style values."""
+    series = pd.Series(values, copy=False)
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return series.astype("boolean")
+    return series.astype("string").str.strip().str.lower().map(FLAG_VALUES).astype("boolean")
+
+
+def apply_schema(df, schema, backend=None):
+    """Convert the columns of ``df`` named in ``schema`` to their dtypes, in place, and return it."""
+    types = dtypes(backend)
+    for column, kind in schema.items():
+        if column not in df:
+            continue
+        values = df[column]
+        if kind == "flag":
+            values = to_flags(values)
+        elif kind == "date" and not pd.api.types.is_datetime64_any_dtype(values):
+            values = parse_dates(values)
+        elif kind in ("number", "money"):
+            values = pd.to_numeric(values, errors="coerce")
+        elif kind == "category" and isinstance(types[kind], pd.ArrowDtype):
+            values = values.astype(NUMPY_DTYPES["text"])
+        df[column] = values.astype(types[kind])
+    return df
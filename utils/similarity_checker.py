@@ -1,25 +1,122 @@
 import pandas as pd
 from difflib import SequenceMatcher
+import asyncio
 import json
+import os
+from utils.variation_store import get_variation_store, model_version
+from utils.goal_index import GoalIndex, get_goal_index
+from utils.vector_matcher import get_vector_matcher
+from utils.tracing import record_usage, span
+
+# "model" asks Gemini for item variations, "vector" matches offline with local embeddings
+MATCHING_ENGINE = os.getenv("STREAMLINE_MATCHING_ENGINE", "model")
 
 def string_similarity(a, b):
     """Calculate basic string similarity."""
     return SequenceMatcher(None, a.lower(), b.lower()).ratio()
 
-def get_item_variations(item, model):
+def get_item_variations(item, model, store=None):
     """Get semantic variations of an item name."""
-    try:
-        prompt = f"""
-        Generate 3-5 common alternative names or descriptions for '{item}' as a comma-separated list.
-        Only return the list, nothing else.
-        Example: if input is "laptop", return "notebook computer, portable computer, personal computer, pc"
-        """
-        response = model.generate_content(prompt)
-        variations = [v.strip() for v in response.text.split(',')]
-        return variations
-    except Exception as e:
-        print(f"Error generating variations: {e}")
-        return [item]
+    store = store or get_variation_store()
+    version = model_version(model)
+    with span("variations.item") as s:
+        variations = store.get(item, version)
+        s.set(cache_hit=variations is not None)
+        if variations is not None:
+            return variations
+
+        try:
+            prompt = f"""
+            Generate 3-5 common alternative names or descriptions for '{item}' as a comma-separated list.
+            Only return the list, nothing else.
+            Example: if input is "laptop", return "notebook computer, portable computer, personal computer, pc"
+            """
+            response = model.generate_content(prompt)
+            record_usage(s, response)
+            variations = [v.strip() for v in response.text.split(',')]
+        except Exception as e:
+            print(f"Error generating variations: {e}")
+            s.set(error=type(e).__name__)
+            return [item]
+
+    store.put(item, variations, version)
+    return variations
+
+def get_batch_variations(items, model, store=None):
+    """
+    Get semantic variations for several items with a single model request.
+
+    Returns a dict of item -> variations. Items the model left out of its
+    answer are missing from the dict so the caller can retry them one by one.
+    """
+    store = store or get_variation_store()
+    with span("variations.batch", items=len(items)) as s:
+        try:
+            prompt = f"""
+            For each item in the JSON list below, generate 3-5 common alternative names or descriptions.
+            Return only a JSON object mapping each item, exactly as given, to a list of strings.
+            Example: for ["laptop"] return {{"laptop": ["notebook computer", "portable computer", "pc"]}}
+
+            Items: {json.dumps(items)}
+            """
+            response = model.generate_content(prompt)
+            record_usage(s, response)
+            json_str = response.text
+            s.set(bytes=len(json_str))
+            if '```json' in json_str:
+                json_str = json_str.split('```json')[1].split('```')[0]
+            answer = json.loads(json_str.strip())
+        except Exception as e:
+            print(f"Error generating batch variations: {e}")
+            s.set(error=type(e).__name__)
+            return {}
+
+    variations = {}
+    for item in items:
+        values = answer.get(item) if isinstance(answer, dict) else None
+        if isinstance(values, list):
+            variations[item] = [str(v).strip() for v in values]
+
+    store.put_many(variations, model_version(model))
+    return variations
+
+def build_goal_index(goals, model=None):
+    """
+    Get the precomputed index for a set of goals.
+
+    Goal-side variations are read from the variation store (they are
+    generated when a goal is created) so building the index never calls
+    the model.
+    """
+    if isinstance(goals, GoalIndex):
+        return goals
+    goal_list = goals if isinstance(goals, list) else goals['Goals'].tolist()
+    if model is None:
+        return get_goal_index(goal_list)
+
+    version = model_version(model)
+    return get_goal_index(
+        goal_list,
+        lambda normalized: get_variation_store().get_many(normalized, version),
+        version
+    )
+
+def match_item_against_goals(item_description, variations, goal_index):
+    """
+    Check an item and its variations against an indexed set of goals.
+
+    Candidate goals come from the index; the best one is chosen by string
+    similarity. Returns (is_suspicious, matched_goal).
+    """
+    best_goal, best_score = None, -1.0
+    for text, key, goal in goal_index.find_matches(item_description, variations):
+        score = string_similarity(text, key)
+        if score > best_score:
+            best_goal, best_score = goal, score
+
+    if best_goal is None:
+        return True, None
+    return False, best_goal
 
 def verify_item_against_goals(item_description, goals, model):
     """
@@ -27,11 +124,10 @@ def verify_item_against_goals(item_description, goals, model):
     
     Args:
         item_description (str): The description of the item to check
-        goals (list or pd.DataFrame): Company goals to check against
+        goals (list, pd.DataFrame or GoalIndex): Company goals to check against
         model: The Gemini model instance
     """
-    # Convert goals to list if it's a DataFrame
-    goal_list = goals if isinstance(goals, list) else goals['Goals'].tolist()
+    goal_index = build_goal_index(goals, model)
     
     # Clean and normalize the item description
     item_description = str(item_description).lower().strip()
@@ -39,15 +135,90 @@ def verify_item_against_goals(item_description, goals, model):
     # Get variations of the item description
     variations = get_item_variations(item_description, model)
     
-    # Check against each goal
-    for goal in goal_list:
-        goal = str(goal).lower().strip()
-        if goal in item_description or item_description in goal:
-            return False, goal
-        
-        # Check variations
-        for variation in variations:
-            if variation.lower().strip() in goal or goal in variation.lower().strip():
-                return False, goal
-    
-    return True, None
+    return match_item_against_goals(item_description, variations, goal_index)
+
+async def get_variations_async(items, model, batch_size=20, max_concurrency=4, store=None):
+    """
+    Get variations for many items using batched requests run concurrently.
+
+    Items already in the variation store are served from it. The rest are
+    sent ``batch_size`` at a time; anything a batch fails to cover falls back
+    to a single-item request. At most ``max_concurrency`` model requests are
+    in flight at once.
+    """
+    store = store or get_variation_store()
+    with span("variations", items=len(items)) as s:
+        variations = store.get_many(items, model_version(model))
+        pending = [item for item in items if item not in variations]
+        s.set(cache_hit=not pending, cached=len(variations))
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def limited(func, *args):
+            async with semaphore:
+                return await asyncio.to_thread(func, *args)
+
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        for result in await asyncio.gather(*(limited(get_batch_variations, batch, model, store) for batch in batches)):
+            variations.update(result)
+
+        # Retry anything the batches missed individually
+        missing = [item for item in pending if item not in variations]
+        singles = await asyncio.gather(*(limited(get_item_variations, item, model, store) for item in missing))
+        variations.update(zip(missing, singles))
+        s.set(batches=len(batches), retried=len(missing))
+        return variations
+
+def verify_items_with_vectors(item_descriptions, goals, model=None):
+    """
+    Compare items against company goals using local embeddings only.
+
+    All items are scored against all goals with one matrix multiply; no
+    model requests are made. Stored goal-side variations are included in
+    the goal matrix when a model is given.
+    """
+    goal_list = goals if isinstance(goals, list) else goals['Goals'].tolist()
+    with span("verify.vectors", items=len(item_descriptions), goals=len(goal_list)):
+        if model is None:
+            matcher = get_vector_matcher(goal_list)
+        else:
+            version = model_version(model)
+            matcher = get_vector_matcher(
+                goal_list,
+                lambda normalized: get_variation_store().get_many(normalized, version),
+                version
+            )
+        return matcher.match([str(description) for description in item_descriptions])
+
+def verify_items_against_goals(item_descriptions, goals, model, batch_size=20, max_concurrency=4, engine=None):
+    """
+    Compare all items of an invoice against company goals.
+
+    Variations for every distinct description are fetched with a few batched
+    model requests instead of one blocking request per item.
+
+    Args:
+        item_descriptions (list): Descriptions of the items to check
+        goals (list, pd.DataFrame or GoalIndex): Company goals to check against
+        model: The Gemini model instance (or any object with ``generate_content``)
+        batch_size (int): Number of descriptions per model request
+        max_concurrency (int): Maximum number of model requests in flight
+        engine (str): "model" or "vector", defaults to MATCHING_ENGINE
+
+    Returns:
+        List of (is_suspicious, matched_goal) tuples, one per description.
+    """
+    if (engine or MATCHING_ENGINE) == "vector" and not isinstance(goals, GoalIndex):
+        return verify_items_with_vectors(item_descriptions, goals, model)
+
+    goal_index = build_goal_index(goals, model)
+    normalized = [str(description).lower().strip() for description in item_descriptions]
+    unique_items = list(dict.fromkeys(normalized))
+
+    variations = asyncio.run(get_variations_async(unique_items, model, batch_size, max_concurrency))
+
+    with span("verify.match", items=len(normalized)):
+        return [
+            match_item_against_goals(item, variations.get(item, [item]), goal_index)
+            for item in normalized
+        ]
@@ -0,0 +1,919 @@
+import copy
+import functools
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date
+
+import pandas as pd
+
+from utils.dates import normalize_dates, to_iso
+from utils.schema import AP_SCHEMA, GOAL_SCHEMA, INVOICE_SCHEMA, ROLLUP_SCHEMA, apply_schema
+
+DB_PATH = os.getenv("STREAMLINE_DB", "streamline.db")
+
+INVOICE_CSV = "invoice_data.csv"
+AP_CSV = "ap.csv"
+GOALS_CSV = "company_goals.csv"
+
+# Display column name -> database column name
+INVOICE_COLUMNS = {
+    "Invoice Number": "invoice_number",
+    "Due Date": "due_date",
+    "Description": "description",
+    "Quantity": "quantity",
+    "Price": "price",
+    "Subtotal": "subtotal",
+    "Tax": "tax",
+    "Total": "total",
+    "Category": "category",
+    "Verified": "verified",
+    "Suspicious": "suspicious",
+    "Department": "department",
+}
+
+DEPARTMENTS = ["HR", "IT", "Finance", "Operations"]
+
+# Due dates are stored as YYYY-MM-DD, so overdue is a plain string comparison
+OVERDUE_SQL = (
+    "CASE WHEN date(i.due_date) IS NOT NULL AND i.due_date < date('now', 'localtime') "
+    "THEN 'Yes' ELSE 'No' END"
+)
+
+# Display column name -> column of the invoices/accounts_payable join
+AP_COLUMNS = {
+    "Id": "i.id",
+    "Invoice Number": "i.invoice_number",
+    "Due Date": "i.due_date",
+    "Price": "i.price",
+    "Total": "i.total",
+    "Category": "i.category",
+    "Verified": "i.verified",
+    "Payment Overdue": OVERDUE_SQL,
+    "Payment Status": "ap.payment_status",
+}
+
+AP_TABLE = "invoices i JOIN accounts_payable ap ON ap.invoice_id = i.id"
+
+GOAL_COLUMNS = {
+    "Goals": "goal",
+    "Number of Items": "number_of_items",
+    "Outcomes": "outcomes",
+    "Due Date": "due_date",
+    "Key Results": "key_results",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY,
+    invoice_number TEXT,
+    due_date TEXT,
+    description TEXT,
+    quantity REAL,
+    price REAL,
+    subtotal REAL,
+    tax REAL,
+    total REAL,
+    category TEXT,
+    verified INTEGER,
+    suspicious INTEGER,
+    department TEXT,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_invoices_number ON invoices (invoice_number);
+CREATE INDEX IF NOT EXISTS idx_invoices_due_date ON invoices (due_date);
+CREATE INDEX IF NOT EXISTS idx_invoices_category ON invoices (category);
+
+CREATE TABLE IF NOT EXISTS accounts_payable (
+    invoice_id INTEGER PRIMARY KEY REFERENCES invoices (id) ON DELETE CASCADE,
+    payment_status TEXT NOT NULL DEFAULT 'Pending',
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_ap_status ON accounts_payable (payment_status);
+
+CREATE TABLE IF NOT EXISTS goals (
+    id INTEGER PRIMARY KEY,
+    goal TEXT NOT NULL,
+    number_of_items INTEGER,
+    outcomes TEXT,
+    due_date TEXT,
+    key_results TEXT
+);
+
+CREATE TABLE IF NOT EXISTS payments (
+    idempotency_key TEXT PRIMARY KEY,
+    invoice_id INTEGER NOT NULL REFERENCES invoices (id) ON DELETE CASCADE,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    reference TEXT,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_payments_state ON payments (state);
+CREATE INDEX IF NOT EXISTS idx_payments_invoice ON payments (invoice_id);
+
+CREATE TABLE IF NOT EXISTS vendor_templates (
+    vendor TEXT PRIMARY KEY,
+    template TEXT NOT NULL,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS expenditure_rollup (
+    month TEXT NOT NULL,
+    category TEXT NOT NULL,
+    department TEXT NOT NULL,
+    total REAL NOT NULL DEFAULT 0,
+    paid_total REAL NOT NULL DEFAULT 0,
+    line_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (month, category, department)
+);
+
+CREATE TABLE IF NOT EXISTS invoice_keys (
+    invoice_key TEXT PRIMARY KEY,
+    invoice_id INTEGER REFERENCES invoices (id) ON DELETE CASCADE,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS documents (
+    sha256 TEXT PRIMARY KEY,
+    dhash TEXT,
+    name TEXT,
+    invoice_key TEXT,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Perceptual hash bands of each document, for near-duplicate lookups
+CREATE TABLE IF NOT EXISTS document_bands (
+    band INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    sha256 TEXT NOT NULL REFERENCES documents (sha256) ON DELETE CASCADE,
+    PRIMARY KEY (band, value, sha256)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS ingest_jobs (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    state TEXT NOT NULL DEFAULT 'Queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    invoice_ids TEXT,
+    last_error TEXT,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_ingest_jobs_state ON ingest_jobs (state);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Rollup key of an invoice line; lines without a usable due date have an empty month
+ROLLUP_KEY_SQL = (
+    "CASE WHEN date(due_date) IS NOT NULL THEN substr(due_date, 1, 7) ELSE '' END, "
+    "COALESCE(category, 'Uncategorized'), COALESCE(department, 'Unassigned')"
+)
+
+_initialized = set()
+
+# Process-wide cache of query results shared by every session, see cached_read
+_reads = OrderedDict()
+_reads_lock = threading.Lock()
+_write_generation = 0
+MAX_CACHED_READS = 64
+
+
+@contextmanager
+def connect(path=None):
+    """
+    Open a connection to the Streamline database.
+
+    The block runs in a single transaction: it commits on success and rolls
+    back if an exception escapes. The schema is created (and existing CSV
+    data imported) the first time a database is opened in this process.
+    """
+    path = path or DB_PATH
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.execute("PRAGMA foreign_keys = ON")
+        if path not in _initialized:
+            _initialize(conn)
+            _initialized.add(path)
+        with conn:
+            yield conn
+        if conn.total_changes:
+            notify_write()
+    finally:
+        conn.close()
+
+
+def notify_write():
+    """Invalidate every cached read; called whenever a write commits in this process."""
+    global _write_generation
+    with _reads_lock:
+        _write_generation += 1
+        _reads.clear()
+
+
+def _data_version(path):
+    """Changes whenever the database is written, by this process or another one."""
+    stats = []
+    for filename in (path, path + "-wal"):
+        try:
+            stat = os.stat(filename)
+            stats.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            stats.append(None)
+    return _write_generation, *stats
+
+
+def cached_read(func=None, *, daily=False):
+    """
+    Serve a read from a process-wide cache shared by all sessions.
+
+    Results are keyed by the database and arguments, and dropped when a
+    write commits in this process or the database files change on disk, so
+    unchanged data is queried once per process instead of on every rerun.
+    Reads whose result depends on today's date (``OVERDUE_SQL``) pass
+    ``daily=True`` so they are also keyed by the date. Callers get their
+    own copy and may modify it. The uncached function is available as
+    ``__wrapped__``.
+    """
+    if func is None:
+        return functools.partial(cached_read, daily=daily)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (func.__name__, DB_PATH, args, tuple(sorted(kwargs.items())))
+        if daily:
+            key += (date.today().isoformat(),)
+        # Versioned before reading, so a write during the query is noticed next time
+        version = _data_version(DB_PATH)
+        with _reads_lock:
+            entry = _reads.get(key)
+            if entry is not None and entry[0] == version:
+                _reads.move_to_end(key)
+                return _copy(entry[1])
+
+        value = func(*args, **kwargs)
+        with _reads_lock:
+            _reads[key] = (version, value)
+            _reads.move_to_end(key)
+            if len(_reads) > MAX_CACHED_READS:
+                _reads.popitem(last=False)
+        return _copy(value)
+    return wrapper
+
+
+def _copy(value):
+    return value.copy() if isinstance(value, pd.DataFrame) else copy.deepcopy(value)
+
+
+def _initialize(conn):
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+
+    # Columns added after the table was first created
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(invoices)")}
+    if "department" not in columns:
+        conn.execute("ALTER TABLE invoices ADD COLUMN department TEXT")
+
+    # Take the write lock so only one process runs each one-off migration
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for key, migration in MIGRATIONS:
+            done = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            if done is None:
+                migration(conn)
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, CURRENT_TIMESTAMP)", (key,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _normalize_due_dates(conn):
+    """Rewrite stored invoice due dates as YYYY-MM-DD where they can be parsed."""
+    rows = conn.execute("SELECT id, due_date FROM invoices WHERE due_date IS NOT NULL").fetchall()
+    if rows:
+        ids, dates = zip(*rows)
+        iso_dates = normalize_dates(list(dates))
+        conn.executemany(
+            "UPDATE invoices SET due_date = ? WHERE id = ?",
+            [(iso, invoice_id) for invoice_id, date, iso in zip(ids, dates, iso_dates) if iso and iso != date]
+        )
+
+
+def _is_missing(value):
+    """None, NaN, NA or NaT."""
+    return value is None or (pd.api.types.is_scalar(value) and pd.isna(value))
+
+
+def _to_bool(value):
+    """Convert CSV booleans ("True", "false", 1, ...) to 0/1/None."""
+    if _is_missing(value):
+        return None
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in ("true", "yes", "1"):
+            return 1
+        if value in ("false", "no", "0"):
+            return 0
+        return None
+    return int(bool(value))
+
+
+def _to_number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if pd.isna(number) else number
+
+
+def _to_text(value):
+    if _is_missing(value):
+        return None
+    return str(value)
+
+
+def _to_date(value):
+    """Due dates from typed frames (Timestamps) are stored as YYYY-MM-DD."""
+    if hasattr(value, "strftime") and not _is_missing(value):
+        return value.strftime("%Y-%m-%d")
+    return _to_text(value)
+
+
+def _invoice_record(row):
+    suspicious = _to_bool(row.get("Suspicious"))
+    verified = _to_bool(row.get("Verified"))
+    if verified is None and suspicious is not None:
+        verified = 1 - suspicious
+    return (
+        _to_text(row.get("Invoice Number")),
+        _to_date(row.get("Due Date")),
+        _to_text(row.get("Description")),
+        _to_number(row.get("Quantity")),
+        _to_number(row.get("Price")),
+        _to_number(row.get("Subtotal")),
+        _to_number(row.get("Tax")),
+        _to_number(row.get("Total")),
+        _to_text(row.get("Category")),
+        verified,
+        suspicious,
+        _to_text(row.get("Department")),
+    )
+
+
+def invoice_key(number, date, total):
+    """
+    Exact duplicate key of an invoice: normalized number, ISO date and total.
+
+    Returns None when the invoice has no number to key on.
+    """
+    number = re.sub(r"\s+", "", _to_text(number) or "").upper()
+    if not number:
+        return None
+    total = _to_number(total)
+    date = _to_text(date)
+    return f"{number}|{(to_iso(date) or date.strip()) if date else ''}|{'' if total is None else f'{total:.2f}'}"
+
+
+def _record_invoice_keys(conn, ids, records):
+    """Index the exact keys of inserted invoice lines; the first line of each invoice wins."""
+    keys = []
+    for invoice_id, record in zip(ids, records):
+        key = invoice_key(record[0], record[1], record[7])  # number, due date, total
+        if key is not None:
+            keys.append((key, invoice_id))
+    conn.executemany("INSERT OR IGNORE INTO invoice_keys (invoice_key, invoice_id) VALUES (?, ?)", keys)
+
+
+def _insert_invoices(conn, rows):
+    ids = []
+    records = [_invoice_record(row) for row in rows]
+    for record in records:
+        cursor = conn.execute(
+            "INSERT INTO invoices (invoice_number, due_date, description, quantity, price, "
+            "subtotal, tax, total, category, verified, suspicious, department) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            record
+        )
+        ids.append(cursor.lastrowid)
+    conn.executemany(
+        "INSERT INTO accounts_payable (invoice_id) VALUES (?)",
+        [(invoice_id,) for invoice_id in ids]
+    )
+    _record_invoice_keys(conn, ids, records)
+    if ids:
+        _add_to_rollup(conn, "id BETWEEN ? AND ?", (min(ids), max(ids)), "total")
+    return ids
+
+
+def _add_to_rollup(conn, where, params, column):
+    """Add the totals of the matching invoice lines to a rollup column."""
+    count = "COUNT(*)" if column == "total" else "0"
+    conn.execute(
+        f"INSERT INTO expenditure_rollup (month, category, department, {column}, line_count) "
+        f"SELECT {ROLLUP_KEY_SQL}, SUM(COALESCE(total, 0)), {count} "
+        f"FROM invoices WHERE {where} GROUP BY 1, 2, 3 "
+        f"ON CONFLICT (month, category, department) DO UPDATE SET "
+        f"{column} = {column} + excluded.{column}, line_count = line_count + excluded.line_count",
+        params
+    )
+
+
+def rebuild_rollups(conn):
+    """Recompute the expenditure rollup from scratch."""
+    conn.execute("DELETE FROM expenditure_rollup")
+    _add_to_rollup(conn, "1 = 1", (), "total")
+    _add_to_rollup(
+        conn,
+        "id IN (SELECT invoice_id FROM accounts_payable WHERE payment_status = 'Successful')",
+        (),
+        "paid_total"
+    )
+
+
+def _read_csv(filename):
+    try:
+        return pd.read_csv(filename, on_bad_lines="skip")
+    except (FileNotFoundError, pd.errors.EmptyDataError):
+        return pd.DataFrame()
+
+
+def import_csvs(conn, invoice_csv=INVOICE_CSV, ap_csv=AP_CSV, goals_csv=GOALS_CSV):
+    """
+    One-shot import of the legacy CSV files into the database.
+
+    Invoice lines become invoices with a Pending payment; payment statuses
+    saved in ap.csv are applied to the matching invoice lines.
+    """
+    invoice_df = _read_csv(invoice_csv)
+    ids = _insert_invoices(conn, invoice_df.to_dict("records"))
+
+    # Match ap.csv rows to imported invoice lines on number, price and total
+    ap_df = _read_csv(ap_csv)
+    if not ap_df.empty and "Payment Status" in ap_df.columns:
+        unmatched = {}
+        for invoice_id, row in zip(ids, invoice_df.to_dict("records")):
+            key = (_to_text(row.get("Invoice Number")), _to_number(row.get("Price")), _to_number(row.get("Total")))
+            unmatched.setdefault(key, []).append(invoice_id)
+        updates = []
+        for row in ap_df.to_dict("records"):
+            key = (_to_text(row.get("Invoice Number")), _to_number(row.get("Price")), _to_number(row.get("Total")))
+            if unmatched.get(key) and _to_text(row.get("Payment Status")):
+                updates.append((row["Payment Status"], unmatched[key].pop(0)))
+        conn.executemany("UPDATE accounts_payable SET payment_status = ? WHERE invoice_id = ?", updates)
+
+    goals_df = _read_csv(goals_csv)
+    for row in goals_df.to_dict("records"):
+        _insert_goal(conn, row)
+
+    return len(ids)
+
+
+def rebuild_invoice_keys(conn):
+    """Recompute the exact duplicate index from the stored invoice lines."""
+    conn.execute("DELETE FROM invoice_keys")
+    keys = []
+    for invoice_id, number, due_date, total in conn.execute(
+        "SELECT id, invoice_number, due_date, total FROM invoices ORDER BY id"
+    ).fetchall():
+        key = invoice_key(number, due_date, total)
+        if key is not None:
+            keys.append((key, invoice_id))
+    conn.executemany("INSERT OR IGNORE INTO invoice_keys (invoice_key, invoice_id) VALUES (?, ?)", keys)
+
+
+# One-off data migrations, run in order and recorded in the meta table
+MIGRATIONS = [
+    ("csv_imported", import_csvs),
+    ("dates_normalized", _normalize_due_dates),
+    ("rollups_built", rebuild_rollups),
+    ("invoice_keys_built", rebuild_invoice_keys),
+]
+
+
+def _select(conn, table, columns, where="", params=()):
+    select = ", ".join(f'{column} AS "{name}"' for name, column in columns.items())
+    return pd.read_sql_query(f"SELECT {select} FROM {table} {where}", conn, params=params)
+
+
+def insert_invoice_rows(rows):
+    """Insert extracted invoice lines (dicts keyed by display column) and return their ids."""
+    with connect() as conn:
+        return _insert_invoices(conn, rows)
+
+
+@cached_read
+def read_invoices():
+    """Read all invoice lines."""
+    with connect() as conn:
+        df = _select(conn, "invoices", INVOICE_COLUMNS, "ORDER BY id")
+    return apply_schema(df, INVOICE_SCHEMA)
+
+
+@cached_read(daily=True)
+def read_accounts_payable():
+    """Read the accounts payable ledger (one row per invoice line)."""
+    with connect() as conn:
+        df = _select(conn, AP_TABLE, AP_COLUMNS, "ORDER BY i.id")
+    return apply_schema(df, AP_SCHEMA)
+
+
+def _ap_filters(overdue=None, category=None, verified=None):
+    """Build a WHERE clause for the accounts payable filters."""
+    clauses, params = [], []
+    if overdue is not None:
+        clauses.append(f"{OVERDUE_SQL} = ?")
+        params.append("Yes" if overdue else "No")
+    if category is not None:
+        clauses.append("i.category = ?")
+        params.append(category)
+    if verified is not None:
+        clauses.append("i.verified = ?")
+        params.append(int(verified))
+    where = "WHERE " + " AND ".join(clauses) if clauses else ""
+    return where, params
+
+
+@cached_read(daily=True)
+def query_accounts_payable(overdue=None, category=None, verified=None, limit=50, offset=0):
+    """Read one page of the accounts payable ledger matching the filters."""
+    where, params = _ap_filters(overdue, category, verified)
+    with connect() as conn:
+        df = _select(conn, AP_TABLE, AP_COLUMNS, f"{where} ORDER BY i.id LIMIT ? OFFSET ?", [*params, limit, offset])
+    return apply_schema(df, AP_SCHEMA)
+
+
+@cached_read(daily=True)
+def count_accounts_payable(overdue=None, category=None, verified=None):
+    """Number of ledger rows matching the filters."""
+    where, params = _ap_filters(overdue, category, verified)
+    with connect() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {AP_TABLE} {where}", params).fetchone()[0]
+
+
+@cached_read(daily=True)
+def accounts_payable_summary():
+    """Aggregate ledger counts: total, overdue and rows per payment status."""
+    with connect() as conn:
+        total, overdue = conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM({OVERDUE_SQL} = 'Yes'), 0) FROM {AP_TABLE}"
+        ).fetchone()
+        statuses = dict(conn.execute(
+            "SELECT payment_status, COUNT(*) FROM accounts_payable GROUP BY payment_status"
+        ).fetchall())
+    return {"total": total, "overdue": overdue, "statuses": statuses}
+
+
+@cached_read
+def list_categories():
+    """Distinct invoice categories."""
+    with connect() as conn:
+        rows = conn.execute(
+            "SELECT DISTINCT category FROM invoices WHERE category IS NOT NULL ORDER BY category"
+        ).fetchall()
+    return [row[0] for row in rows]
+
+
+@cached_read
+def read_expenditure_rollup(department=None):
+    """
+    Read precomputed expenditure totals per month and category.
+
+    Totals are summed over departments unless one is given.
+    """
+    where, params = ("WHERE department = ?", [department]) if department else ("", [])
+    with connect() as conn:
+        df = pd.read_sql_query(
+            f'SELECT month AS "Month", category AS "Category", SUM(total) AS "Total", '
+            f'SUM(paid_total) AS "Paid", SUM(line_count) AS "Lines" '
+            f"FROM expenditure_rollup {where} GROUP BY month, category ORDER BY month, category",
+            conn,
+            params=params
+        )
+    return apply_schema(df, ROLLUP_SCHEMA)
+
+
+def create_payments(invoice_ids, key_prefix="invoice"):
+    """
+    Create Pending payment jobs for invoice lines.
+
+    Each invoice line has one idempotency key, so submitting it twice never
+    creates a second payment. Failed payments are reset to Pending. Returns
+    the keys of the jobs that are now Pending.
+    """
+    keys = {f"{key_prefix}-{int(invoice_id)}": int(invoice_id) for invoice_id in invoice_ids}
+    if not keys:
+        return []
+    with connect() as conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO payments (idempotency_key, invoice_id, state) VALUES (?, ?, 'Pending')",
+            list(keys.items())
+        )
+        conn.executemany(
+            "UPDATE payments SET state = 'Pending', last_error = NULL, updated_at = CURRENT_TIMESTAMP "
+            "WHERE idempotency_key = ? AND state = 'Failed'",
+            [(key,) for key in keys]
+        )
+        conn.executemany(
+            "UPDATE accounts_payable SET payment_status = 'Pending', updated_at = CURRENT_TIMESTAMP "
+            "WHERE invoice_id = ? AND payment_status = 'Failed'",
+            [(invoice_id,) for invoice_id in keys.values()]
+        )
+        pending = []
+        key_list = list(keys)
+        for start in range(0, len(key_list), 500):
+            chunk = key_list[start:start + 500]
+            rows = conn.execute(
+                f"SELECT idempotency_key FROM payments WHERE state = 'Pending' "
+                f"AND idempotency_key IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall()
+            pending += [row[0] for row in rows]
+    return pending
+
+
+def transition_payment(key, from_states, to_state, error=None, reference=None, attempt=False):
+    """
+    Move a payment job to ``to_state`` if it is currently in one of ``from_states``.
+
+    The job and the invoice's payment status are updated in one transaction.
+    Returns False if the job was not in an allowed state.
+    """
+    with connect() as conn:
+        cursor = conn.execute(
+            f"UPDATE payments SET state = ?, last_error = ?, reference = COALESCE(?, reference), "
+            f"attempts = attempts + ?, updated_at = CURRENT_TIMESTAMP "
+            f"WHERE idempotency_key = ? AND state IN ({','.join('?' * len(from_states))})",
+            [to_state, error, reference, int(attempt), key, *from_states]
+        )
+        if cursor.rowcount == 0:
+            return False
+        conn.execute(
+            "UPDATE accounts_payable SET payment_status = ?, updated_at = CURRENT_TIMESTAMP "
+            "WHERE invoice_id = (SELECT invoice_id FROM payments WHERE idempotency_key = ?)",
+            (to_state, key)
+        )
+        if to_state == "Successful":
+            _add_to_rollup(
+                conn,
+                "id = (SELECT invoice_id FROM payments WHERE idempotency_key = ?)",
+                (key,),
+                "paid_total"
+            )
+    return True
+
+
+def renew_payment(key):
+    """Extend the lease on a Submitted job, so other engines don't take it over while it retries."""
+    with connect() as conn:
+        conn.execute(
+            "UPDATE payments SET updated_at = CURRENT_TIMESTAMP WHERE idempotency_key = ? AND state = 'Submitted'",
+            (key,)
+        )
+
+
+def requeue_stale_payments(lease_seconds):
+    """
+    Move Submitted jobs not touched for ``lease_seconds`` back to Pending.
+
+    Their engine crashed or stopped mid-payment; jobs another engine is
+    still working on keep renewing their lease. Returns the number moved.
+    """
+    stale = "state = 'Submitted' AND updated_at < datetime('now', ?)"
+    cutoff = f"-{int(lease_seconds)} seconds"
+    with connect() as conn:
+        conn.execute(
+            f"UPDATE accounts_payable SET payment_status = 'Pending', updated_at = CURRENT_TIMESTAMP "
+            f"WHERE invoice_id IN (SELECT invoice_id FROM payments WHERE {stale})",
+            (cutoff,)
+        )
+        cursor = conn.execute(
+            f"UPDATE payments SET state = 'Pending', last_error = 'Interrupted, retrying', "
+            f"updated_at = CURRENT_TIMESTAMP WHERE {stale}",
+            (cutoff,)
+        )
+        return cursor.rowcount
+
+
+def read_payment_jobs(states):
+    """Payment jobs in the given states with the amount to pay."""
+    with connect() as conn:
+        return pd.read_sql_query(
+            f"SELECT p.idempotency_key, p.invoice_id, p.state, p.attempts, "
+            f"COALESCE(i.quantity * i.price, i.price, i.total) AS amount "
+            f"FROM payments p JOIN invoices i ON i.id = p.invoice_id "
+            f"WHERE p.state IN ({','.join('?' * len(states))}) ORDER BY p.created_at",
+            conn,
+            params=list(states)
+        )
+
+
+def payment_summary():
+    """Number of payment jobs per state."""
+    with connect() as conn:
+        return dict(conn.execute("SELECT state, COUNT(*) FROM payments GROUP BY state").fetchall())
+
+
+def find_invoice(key):
+    """The first stored line of the invoice with this exact key, or None."""
+    with connect() as conn:
+        row = conn.execute(
+            "SELECT k.invoice_id, i.invoice_number, i.due_date, i.total, k.created_at "
+            "FROM invoice_keys k JOIN invoices i ON i.id = k.invoice_id WHERE k.invoice_key = ?",
+            (key,)
+        ).fetchone()
+    if row is None:
+        return None
+    return dict(zip(["invoice_id", "invoice_number", "due_date", "total", "created_at"], row))
+
+
+def invoice_header_recorded(prefix):
+    """Whether any recorded invoice key starts with ``prefix``, the number and date part of an ``invoice_key``."""
+    with connect() as conn:
+        # "}" sorts right after the "|" separator, so this range is exactly the keys with the prefix
+        row = conn.execute(
+            "SELECT 1 FROM invoice_keys WHERE invoice_key >= ? AND invoice_key < ? LIMIT 1",
+            (prefix, prefix[:-1] + "}")
+        ).fetchone()
+    return row is not None
+
+
+def find_document(sha256, bands=None):
+    """
+    Previously processed documents matching a content hash or sharing a perceptual hash band.
+
+    Returns a list of dicts; an exact content match is the only entry when present.
+    """
+    columns = ["sha256", "dhash", "name", "invoice_key", "created_at"]
+    select = ", ".join(f"d.{column}" for column in columns)
+    with connect() as conn:
+        row = conn.execute(f"SELECT {select} FROM documents d WHERE d.sha256 = ?", (sha256,)).fetchone()
+        if row is not None:
+            return [dict(zip(columns, row))]
+        if not bands:
+            return []
+        rows = conn.execute(
+            f"SELECT DISTINCT {select} FROM document_bands b JOIN documents d ON d.sha256 = b.sha256 "
+            f"WHERE " + " OR ".join("(b.band = ? AND b.value = ?)" for _ in bands),
+            [value for band in enumerate(bands) for value in band]
+        ).fetchall()
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def record_document(sha256, dhash=None, bands=None, name=None, invoice_key=None):
+    """Remember a processed document so resubmissions are caught before OCR."""
+    with connect() as conn:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO documents (sha256, dhash, name, invoice_key) VALUES (?, ?, ?, ?)",
+            (sha256, dhash, name, invoice_key)
+        )
+        if cursor.rowcount and bands:
+            conn.executemany(
+                "INSERT OR IGNORE INTO document_bands (band, value, sha256) VALUES (?, ?, ?)",
+                [(band, value, sha256) for band, value in enumerate(bands)]
+            )
+
+
+def queue_ingest_jobs(files):
+    """
+    Queue files for headless ingestion; ``files`` are (path, size, mtime) tuples.
+
+    Files already known are left alone unless their size or mtime changed,
+    in which case they are queued again. Returns the number of jobs queued.
+    """
+    with connect() as conn:
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT INTO ingest_jobs (path, size, mtime) VALUES (?, ?, ?) "
+            "ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime = excluded.mtime, "
+            "state = 'Queued', attempts = 0, last_error = NULL, invoice_ids = NULL, updated_at = CURRENT_TIMESTAMP "
+            "WHERE size IS NOT excluded.size OR mtime IS NOT excluded.mtime",
+            list(files)
+        )
+        return conn.total_changes - before
+
+
+def read_ingest_jobs(states, limit=None):
+    """Ingest jobs in the given states, oldest first."""
+    with connect() as conn:
+        return pd.read_sql_query(
+            f"SELECT path, state, attempts, last_error FROM ingest_jobs "
+            f"WHERE state IN ({','.join('?' * len(states))}) ORDER BY created_at, path "
+            f"{'LIMIT ?' if limit else ''}",
+            conn,
+            params=[*states, *([limit] if limit else [])]
+        )
+
+
+def update_ingest_job(path, state, error=None, invoice_ids=None, attempt=False):
+    """Record the progress of an ingest job."""
+    with connect() as conn:
+        conn.execute(
+            "UPDATE ingest_jobs SET state = ?, last_error = ?, invoice_ids = COALESCE(?, invoice_ids), "
+            "attempts = attempts + ?, updated_at = CURRENT_TIMESTAMP WHERE path = ?",
+            (state, error, json.dumps(invoice_ids) if invoice_ids is not None else None, int(attempt), path)
+        )
+
+
+def requeue_ingest_jobs(from_states, max_attempts=None):
+    """Move jobs back to Queued, e.g. after a crash or to retry failures. Returns the number moved."""
+    with connect() as conn:
+        cursor = conn.execute(
+            f"UPDATE ingest_jobs SET state = 'Queued', updated_at = CURRENT_TIMESTAMP "
+            f"WHERE state IN ({','.join('?' * len(from_states))})"
+            f"{' AND attempts < ?' if max_attempts else ''}",
+            [*from_states, *([max_attempts] if max_attempts else [])]
+        )
+        return cursor.rowcount
+
+
+def release_ingest_jobs(paths):
+    """Put interrupted jobs back to Queued without counting the attempt they lost."""
+    with connect() as conn:
+        conn.executemany(
+            "UPDATE ingest_jobs SET state = 'Queued', attempts = MAX(attempts - 1, 0), "
+            "updated_at = CURRENT_TIMESTAMP WHERE path = ?",
+            [(path,) for path in paths]
+        )
+
+
+def fail_ingest_jobs(from_states, error):
+    """Mark every job in ``from_states`` as Failed. Returns the number marked."""
+    with connect() as conn:
+        cursor = conn.execute(
+            f"UPDATE ingest_jobs SET state = 'Failed', last_error = ?, updated_at = CURRENT_TIMESTAMP "
+            f"WHERE state IN ({','.join('?' * len(from_states))})",
+            [error, *from_states]
+        )
+        return cursor.rowcount
+
+
+def ingest_summary():
+    """Number of ingest jobs per state."""
+    with connect() as conn:
+        return dict(conn.execute("SELECT state, COUNT(*) FROM ingest_jobs GROUP BY state").fetchall())
+
+
+def _insert_goal(conn, goal):
+    number_of_items = _to_number(goal.get("Number of Items"))
+    cursor = conn.execute(
+        "INSERT INTO goals (goal, number_of_items, outcomes, due_date, key_results) VALUES (?, ?, ?, ?, ?)",
+        (
+            _to_text(goal.get("Goals")) or "",
+            int(number_of_items) if number_of_items is not None else None,
+            _to_text(goal.get("Outcomes")),
+            _to_text(goal.get("Due Date")),
+            _to_text(goal.get("Key Results")),
+        )
+    )
+    return cursor.lastrowid
+
+
+def insert_goal(goal):
+    """Insert a company goal (dict keyed by display column) and return its id."""
+    with connect() as conn:
+        return _insert_goal(conn, goal)
+
+
+@cached_read
+def read_goals():
+    """Read all company goals."""
+    with connect() as conn:
+        df = _select(conn, "goals", GOAL_COLUMNS, "ORDER BY id")
+    return apply_schema(df, GOAL_SCHEMA)
+
+
+def get_vendor_template(vendor):
+    """Return the learned extraction template for a vendor, or None."""
+    with connect() as conn:
+        row = conn.execute("SELECT template FROM vendor_templates WHERE vendor = ?", (vendor,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def save_vendor_template(vendor, template):
+    """Store the learned extraction template for a vendor."""
+    with connect() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO vendor_templates (vendor, template, updated_at) "
+            "VALUES (?, ?, CURRENT_TIMESTAMP)",
+            (vendor, json.dumps(template))
+        )
+
+
+if __name__ == "__main__":
+    # python -m utils.storage [db path]: create the database and import the CSV files
+    path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    with connect(path) as conn:
+        count = conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+    print(f"{path}: {count} invoice lines")
@@ -0,0 +1,271 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent rotations are caught as OSError instead
+    fcntl = None
+
+TRACING = os.getenv("STREAMLINE_TRACING", "1") != "0"
+TRACE_LOG = os.getenv("STREAMLINE_TRACE_LOG", "traces.jsonl")
+TRACE_MAX_BYTES = int(os.getenv("STREAMLINE_TRACE_MAX_BYTES", str(5 * 1024 * 1024)))
+TRACE_BACKUPS = 3
+
+_current = contextvars.ContextVar("streamline_span", default=None)
+
+# read_traces results keyed by the log files' (mtime, size)
+_read_cache = {}
+_read_cache_lock = threading.Lock()
+
+
+class Span:
+    """A timed operation. Attributes set on it are written with its duration."""
+
+    __slots__ = ("name", "trace", "parent", "attrs")
+
+    def __init__(self, name, trace, parent, attrs):
+        self.name = name
+        self.trace = trace
+        self.parent = parent
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class _NoopSpan:
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+@contextmanager
+def _rotation_lock(path):
+    """Serialize rotation across every process writing ``path``."""
+    with open(f"{path}.lock", "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _rotate(path):
+    """Shift ``path`` to ``path.1`` (and so on) unless another process already did."""
+    with _rotation_lock(path):
+        try:
+            if os.path.getsize(path) <= TRACE_MAX_BYTES:
+                return
+        except FileNotFoundError:
+            return
+        for n in range(TRACE_BACKUPS - 1, 0, -1):
+            if os.path.exists(f"{path}.{n}"):
+                os.replace(f"{path}.{n}", f"{path}.{n + 1}")
+        os.replace(path, f"{path}.1")
+
+
+def _append(line, path=None):
+    """
+    Append one line to the trace log.
+
+    Every line is a single O_APPEND write, so the web app, OCR and ingest
+    worker processes can share the log without interleaving records. The
+    log is rotated under a file lock once it exceeds TRACE_MAX_BYTES.
+    """
+    path = path or TRACE_LOG
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (line + "\n").encode("utf-8"))
+        size = os.fstat(fd).st_size
+    finally:
+        os.close(fd)
+    if size > TRACE_MAX_BYTES:
+        _rotate(path)
+
+
+def _write(name, start, duration_ms, trace, parent, attrs):
+    record = {
+        "ts": round(start, 3),
+        "name": name,
+        "duration_ms": round(duration_ms, 3),
+        "trace": trace,
+        "parent": parent,
+        **attrs,
+    }
+    try:
+        _append(json.dumps(record, default=str))
+    except OSError:
+        pass  # Tracing must never break the request it is measuring
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Time the enclosed block and append it to the trace log.
+
+    Spans opened inside another span share its trace id and inherit its
+    ``document`` attribute. Exceptions are recorded and re-raised.
+
+        with span("extract", bytes=len(text)) as s:
+            ...
+            s.set(cache_hit=True)
+    """
+    if not TRACING:
+        yield _NOOP
+        return
+
+    parent = _current.get()
+    if parent is not None and "document" in parent.attrs:
+        attrs.setdefault("document", parent.attrs["document"])
+    current = Span(name, parent.trace if parent else uuid.uuid4().hex[:16], parent.name if parent else None, attrs)
+    token = _current.set(current)
+    wall_start = time.time()
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        _write(name, wall_start, (time.perf_counter() - start) * 1000, current.trace, current.parent, attrs)
+
+
+def record(name, duration_ms, **attrs):
+    """Record an operation timed elsewhere, e.g. in a worker process."""
+    if not TRACING:
+        return
+    parent = _current.get()
+    _write(
+        name,
+        time.time() - duration_ms / 1000,
+        duration_ms,
+        parent.trace if parent else uuid.uuid4().hex[:16],
+        parent.name if parent else None,
+        attrs,
+    )
+
+
+def record_usage(current, response):
+    """Copy the token counts of a Gemini response onto a span."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        current.set(
+            prompt_tokens=getattr(usage, "prompt_token_count", None),
+            output_tokens=getattr(usage, "candidates_token_count", None),
+        )
+
+
+def _read_newest(files, limit):
+    """Parse up to ``limit`` records from ``files`` (newest first), returned oldest first."""
+    records = []
+    for filename in files:
+        try:
+            with open(filename, "rb") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            continue
+        for line in reversed(lines):
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+            if limit and len(records) >= limit:
+                return records[::-1]
+    return records[::-1]
+
+
+def read_traces(limit=50000, path=None):
+    """
+    The most recent ``limit`` spans from the trace log and its rotated backups.
+
+    Files are read newest first and only until ``limit`` records are found.
+    Results are reused until a log file's mtime or size changes.
+    """
+    path = path or TRACE_LOG
+    files = [path] + [f"{path}.{n}" for n in range(1, TRACE_BACKUPS + 1)]
+    stats = []
+    for filename in files:
+        try:
+            stat = os.stat(filename)
+            stats.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            stats.append(None)
+    key = (path, limit, tuple(stats))
+    with _read_cache_lock:
+        cached = _read_cache.get(key)
+    if cached is None:
+        cached = pd.DataFrame(_read_newest(files, limit))
+        with _read_cache_lock:
+            # Only the latest state of each log is worth keeping
+            for old in [k for k in _read_cache if k[:2] == key[:2]]:
+                del _read_cache[old]
+            _read_cache[key] = cached
+    return cached.copy()
+
+
+def stage_summary(traces):
+    """Count, p50/p95/max duration, cache hit rate, bytes and tokens per span name."""
+    if traces.empty:
+        return pd.DataFrame()
+    traces = traces.copy()
+    for column in ("bytes", "prompt_tokens", "output_tokens"):
+        traces[column] = pd.to_numeric(traces[column], errors="coerce") if column in traces else float("nan")
+    if "cache_hit" not in traces:
+        traces["cache_hit"] = None
+    grouped = traces.groupby("name")
+    summary = pd.DataFrame({
+        "Count": grouped.size(),
+        "p50 (ms)": grouped["duration_ms"].quantile(0.5),
+        "p95 (ms)": grouped["duration_ms"].quantile(0.95),
+        "Max (ms)": grouped["duration_ms"].max(),
+        "Cache Hit Rate": grouped["cache_hit"].apply(lambda hits: hits.dropna().astype(bool).mean()),
+        "Bytes": grouped["bytes"].sum(min_count=1),
+        "Tokens": grouped["prompt_tokens"].sum(min_count=1).add(grouped["output_tokens"].sum(min_count=1), fill_value=0),
+    })
+    return summary.sort_values("p95 (ms)", ascending=False).round(1)
+
+
+def slowest_documents(traces, n=10):
+    """
+    The slowest recently processed documents with a per-stage breakdown.
+
+    Each "document" span is joined to the stages recorded in its trace and
+    to the latest OCR span of the same document that preceded it.
+    """
+    if traces.empty or "document" not in traces.columns:
+        return pd.DataFrame()
+    documents = traces[(traces["name"] == "document") & traces["document"].notna()]
+    if documents.empty:
+        return pd.DataFrame()
+
+    stages = traces[traces["trace"].isin(documents["trace"]) & (traces["parent"] == "document")]
+    breakdown = stages.pivot_table(index="trace", columns="name", values="duration_ms", aggfunc="sum")
+    result = documents[["trace", "ts", "document", "duration_ms"]].merge(breakdown, left_on="trace", right_index=True, how="left")
+
+    # OCR run ahead of the document span (e.g. in parallel for a whole upload)
+    ocr = traces[(traces["name"] == "ocr") & traces["document"].notna() & (traces["parent"] != "document")]
+    if not ocr.empty:
+        result = pd.merge_asof(
+            result.sort_values("ts"),
+            ocr[["ts", "document", "duration_ms"]].rename(columns={"duration_ms": "_ocr"}).sort_values("ts"),
+            on="ts", by="document", direction="backward"
+        )
+        # Documents whose trace has its own OCR span already include it
+        external = result["_ocr"].where(result["ocr"].isna()) if "ocr" in result else result["_ocr"]
+        result["duration_ms"] = result["duration_ms"] + external.fillna(0)
+        result["ocr"] = result["ocr"].fillna(external) if "ocr" in result else external
+        result = result.drop(columns="_ocr")
+
+    result["ts"] = pd.to_datetime(result["ts"], unit="s").dt.floor("s")
+    stage_columns = [column for column in result.columns if column not in ("trace", "ts", "document", "duration_ms")]
+    result = result[["ts", "document", "duration_ms", *sorted(stage_columns, key=lambda c: c != "ocr")]]
+    result = result.rename(columns={"ts": "Time", "document": "Document", "duration_ms": "Total (ms)"})
+    return result.sort_values("Total (ms)", ascending=False).head(n).round(1)
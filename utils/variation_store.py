@@ -0,0 +1,114 @@
+import json
+import os
+import sqlite3
+import time
+
+VARIATION_DB = os.getenv("STREAMLINE_VARIATION_DB", "variations.db")
+VARIATION_TTL = int(os.getenv("STREAMLINE_VARIATION_TTL", str(90 * 24 * 60 * 60)))
+
+
+def normalize_description(description):
+    """Normalize an item description for use as a store key."""
+    return " ".join(str(description).lower().split())
+
+
+def model_version(model):
+    """Identify the model that generated a set of variations."""
+    return getattr(model, "model_name", None) or type(model).__name__
+
+
+class VariationStore:
+    """
+    Durable item variation store backed by SQLite.
+
+    The database is shared by every session and server process. Entries are
+    keyed by normalized description and model version, so switching models
+    never serves stale variations, and they expire after ``ttl`` seconds.
+    """
+
+    def __init__(self, path=VARIATION_DB, ttl=VARIATION_TTL):
+        self.path = path
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS variations (
+                    description TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    variations TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (description, model)
+                )
+            """)
+
+    def _connect(self):
+        # A connection per call keeps the store safe to use from worker threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_many(self, descriptions, version):
+        """Return a dict of description -> variations for every fresh entry."""
+        keys = {}
+        for description in descriptions:
+            keys.setdefault(normalize_description(description), []).append(description)
+        if not keys:
+            return {}
+
+        cutoff = time.time() - self.ttl
+        found = {}
+        key_list = list(keys)
+        with self._connect() as conn:
+            # Stay well below SQLite's bound parameter limit
+            for start in range(0, len(key_list), 500):
+                chunk = key_list[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT description, variations FROM variations "
+                    f"WHERE model = ? AND created_at >= ? AND description IN ({placeholders})",
+                    [version, cutoff, *chunk]
+                ).fetchall()
+                for description, variations in rows:
+                    for original in keys[description]:
+                        found[original] = json.loads(variations)
+        return found
+
+    def get(self, description, version):
+        """Return stored variations for a description, or None."""
+        return self.get_many([description], version).get(description)
+
+    def put_many(self, variations, version):
+        """Store a dict of description -> variations."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO variations (description, model, variations, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                [(normalize_description(d), version, json.dumps(v), now) for d, v in variations.items()]
+            )
+
+    def put(self, description, variations, version):
+        """Store the variations of a single description."""
+        self.put_many({description: variations}, version)
+
+    def invalidate(self, keep_version=None):
+        """Delete entries from every model except ``keep_version`` (or all entries)."""
+        with self._connect() as conn:
+            if keep_version is None:
+                conn.execute("DELETE FROM variations")
+            else:
+                conn.execute("DELETE FROM variations WHERE model != ?", (keep_version,))
+
+    def purge_expired(self):
+        """Delete entries older than the TTL."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM variations WHERE created_at < ?", (time.time() - self.ttl,))
+
+
+_store = None
+
+
+def get_variation_store():
+    """Process-wide variation store instance."""
+    global _store
+    if _store is None:
+        _store = VariationStore()
+    return _store
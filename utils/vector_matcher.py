@@ -0,0 +1,151 @@
+import os
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+EMBEDDING_DIM = int(os.getenv("STREAMLINE_EMBEDDING_DIM", "2048"))
+NGRAM_RANGE = (2, 4)
+MATCH_THRESHOLD = float(os.getenv("STREAMLINE_MATCH_THRESHOLD", "0.4"))
+CHUNK_SIZE = 10000
+
+
+def normalize_text(text):
+    """Normalize text before embedding."""
+    return " ".join(str(text).lower().split())
+
+
+def embed_texts(texts, dim=EMBEDDING_DIM, ngram_range=NGRAM_RANGE):
+    """
+    Encode texts as L2-normalized hashed character n-gram vectors.
+
+    Each n-gram is hashed (crc32, so vectors are stable across processes)
+    into one of ``dim`` buckets. Returns a float32 matrix of shape (len(texts), dim).
+    """
+    rows, cols = [], []
+    for row, text in enumerate(texts):
+        padded = f" {normalize_text(text)} "
+        for n in range(ngram_range[0], ngram_range[1] + 1):
+            for i in range(len(padded) - n + 1):
+                rows.append(row)
+                cols.append(zlib.crc32(padded[i:i + n].encode("utf-8")) % dim)
+
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    np.add.at(matrix, (rows, cols), 1.0)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class VectorGoalMatcher:
+    """
+    Offline goal matcher based on cosine similarity of local embeddings.
+
+    Goal vectors (goal text plus any precomputed variations) are kept in one
+    contiguous matrix, so all items of an invoice are scored against all
+    goals with a single matrix multiply and no network calls.
+    """
+
+    def __init__(self, goals, goal_variations=None, dim=EMBEDDING_DIM, threshold=MATCH_THRESHOLD):
+        goal_variations = goal_variations or {}
+        self.dim = dim
+        self.threshold = threshold
+        self.goals = list(dict.fromkeys(normalize_text(goal) for goal in goals))
+
+        keys, key_goals = [], []
+        for goal_id, goal in enumerate(self.goals):
+            for key in dict.fromkeys([goal, *(normalize_text(v) for v in goal_variations.get(goal, []))]):
+                if key:
+                    keys.append(key)
+                    key_goals.append(goal_id)
+
+        self.key_goals = np.asarray(key_goals, dtype=np.int64)
+        self.matrix = np.ascontiguousarray(embed_texts(keys, dim).T)
+
+    def __len__(self):
+        return len(self.goals)
+
+    def scores(self, items):
+        """Best similarity of each item to each goal, shape (len(items), len(goals))."""
+        key_scores = embed_texts(items, self.dim) @ self.matrix
+        goal_scores = np.full((len(items), len(self.goals)), -1.0, dtype=np.float32)
+        if key_scores.size:
+            # Several keys (variations) can belong to one goal; keep the best
+            np.maximum.at(goal_scores, (slice(None), self.key_goals), key_scores)
+        return goal_scores
+
+    def best_matches(self, items):
+        """Return (best goal ids, best scores) for each item."""
+        if not self.goals or not len(items):
+            return np.full(len(items), -1), np.zeros(len(items), dtype=np.float32)
+        scores = self.scores(items)
+        best = scores.argmax(axis=1)
+        return best, scores[np.arange(len(items)), best]
+
+    def match(self, items, threshold=None):
+        """
+        Match a batch of items against the goals.
+
+        Returns a list of (is_suspicious, matched_goal) tuples, one per item.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        best, best_scores = self.best_matches(items)
+        return [
+            (False, self.goals[goal_id]) if goal_id >= 0 and score >= threshold else (True, None)
+            for goal_id, score in zip(best, best_scores)
+        ]
+
+
+_matchers = OrderedDict()
+
+
+def get_vector_matcher(goals, load_variations=None, version=None, maxsize=8):
+    """Return a VectorGoalMatcher for a goal list, reusing a previously built one."""
+    normalized = tuple(normalize_text(goal) for goal in goals)
+    key = (normalized, version)
+    matcher = _matchers.get(key)
+    if matcher is None:
+        goal_variations = load_variations(list(normalized)) if load_variations else None
+        matcher = VectorGoalMatcher(normalized, goal_variations)
+        _matchers[key] = matcher
+        if len(_matchers) > maxsize:
+            _matchers.popitem(last=False)
+    else:
+        _matchers.move_to_end(key)
+    return matcher
+
+
+def clear_vector_matchers():
+    """Forget all cached matchers (e.g. after goals change)."""
+    _matchers.clear()
+
+
+def rescreen_invoices(invoice_df, goals, threshold=MATCH_THRESHOLD, chunk_size=CHUNK_SIZE):
+    """
+    Re-screen historical invoice lines against a (possibly changed) goal set.
+
+    Each distinct description is embedded once and scored in chunks, so
+    memory stays bounded for very large histories.
+
+    Returns a copy of ``invoice_df`` with "Matched Goal", "Match Score" and
+    "Suspicious" columns.
+    """
+    matcher = goals if isinstance(goals, VectorGoalMatcher) else VectorGoalMatcher(goals, threshold=threshold)
+    descriptions = invoice_df["Description"].fillna("").astype(str)
+    codes, uniques = pd.factorize(descriptions)
+
+    best = np.empty(len(uniques), dtype=np.int64)
+    best_scores = np.empty(len(uniques), dtype=np.float32)
+    for start in range(0, len(uniques), chunk_size):
+        chunk = list(uniques[start:start + chunk_size])
+        best[start:start + len(chunk)], best_scores[start:start + len(chunk)] = matcher.best_matches(chunk)
+
+    goal_names = np.asarray(matcher.goals + [None], dtype=object)
+    matched = np.where(best_scores >= threshold, best, -1)
+
+    result = invoice_df.copy()
+    result["Match Score"] = best_scores[codes]
+    result["Matched Goal"] = goal_names[matched][codes]
+    result["Suspicious"] = matched[codes] < 0
+    return result